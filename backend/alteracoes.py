@@ -0,0 +1,135 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+
+from . import avatars
+from .difusao import difusao
+from .eventos import barramento
+from .models import AlteracaoCampo, Personagem
+
+# ==============================================================================
+# SINCRONIZAÇÃO POR DELTA + CONCORRÊNCIA OTIMISTA
+# ==============================================================================
+# Toda escrita sobe Personagem.versao (ver models.py). Aqui guardamos, por
+# campo, a versão da última mudança: uma linha por (personagem, campo), então
+# a tabela não cresce com o uso. Com isso:
+#   - /changes?since=N devolve só os campos com versão > N;
+#   - uma escrita que traz _versao=N é recusada se algum dos campos que ela
+#     altera mudou depois de N (outra aba/usuário salvou antes).
+# Cada página da ficha manda também _aba (um id aleatório por carregamento).
+# A mudança mais recente de um campo feita pela mesma aba não é conflito: dois
+# cliques seguidos no mesmo campo saem com a mesma _versao antes da primeira
+# resposta, e a aba não pode recusar o próprio save.
+
+ESPERA_MAXIMA = 25  # segundos de long-poll (abaixo do timeout típico de proxy)
+
+# Nunca vêm do cliente e não fazem sentido para a tela
+CAMPOS_INTERNOS = {"id", "usuario_id", "versao"}
+TAMANHO_ABA = 64
+
+
+def topico_ficha(char_id: int) -> str:
+    return f"ficha:{char_id}"
+
+
+def campo_sincronizado(campo: str) -> bool:
+    return campo in Personagem.__table__.columns and campo not in CAMPOS_INTERNOS
+
+
+def ler_aba(valor) -> Optional[str]:
+    """_aba vinda do cliente; qualquer coisa fora do formato vale como aba desconhecida."""
+    if isinstance(valor, str) and 0 < len(valor) <= TAMANHO_ABA:
+        return valor
+    return None
+
+
+def _insert(dialeto: str):
+    return postgresql.insert if dialeto == "postgresql" else sqlite.insert
+
+
+async def registrar(session, dialeto: str, char_id: int, campos: Iterable[str], versao: int,
+                    aba: Optional[str] = None):
+    """Grava a versão dos campos alterados, na mesma transação da escrita.
+
+    Como a escrita trava a linha do personagem até o commit, as versões ficam
+    visíveis em ordem e um /changes nunca pula uma delas.
+    """
+    campos = sorted({c for c in campos if campo_sincronizado(c)})
+    if not campos:
+        return
+    stmt = _insert(dialeto)(AlteracaoCampo).values(
+        [{"personagem_id": char_id, "campo": campo, "versao": versao, "aba": aba} for campo in campos]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["personagem_id", "campo"],
+        set_={"versao": stmt.excluded.versao, "aba": stmt.excluded.aba},
+    )
+    await session.execute(stmt)
+
+
+def publicar(char_id: int, versao: int):
+    # Acorda os long-polls desta ficha; eles mesmos consultam o que mudou
+    barramento.publicar(topico_ficha(char_id), {"tipo": "alteracao", "versao": versao})
+    difusao.enviar("ficha", {"id": char_id, "versao": versao})
+
+
+@difusao.tratador("ficha")
+def _alteracao_remota(dados: dict):
+    # Escrita feita em outro worker: acorda os long-polls deste
+    barramento.publicar(topico_ficha(dados["id"]), {"tipo": "alteracao", "versao": dados["versao"]})
+
+
+async def conflitos(session, char_id: int, campos: Iterable[str], desde: int, aba: Optional[str] = None) -> list:
+    """Campos (dentre os informados) que outra aba mudou depois da versão 'desde'."""
+    campos = [c for c in campos if campo_sincronizado(c)]
+    if not campos:
+        return []
+    stmt = select(AlteracaoCampo.campo).where(
+        AlteracaoCampo.personagem_id == char_id,
+        AlteracaoCampo.versao > desde,
+        AlteracaoCampo.campo.in_(campos),
+    )
+    if aba is not None:
+        stmt = stmt.where(or_(AlteracaoCampo.aba.is_(None), AlteracaoCampo.aba != aba))
+    return list((await session.exec(stmt)).all())
+
+
+async def valores(session, char_id: int, campos: Iterable[str]) -> Optional[dict]:
+    """Valores atuais de alguns campos (só essas colunas são lidas)."""
+    campos = [c for c in campos if campo_sincronizado(c)]
+    colunas = [Personagem.id] + [getattr(Personagem, c) for c in campos]
+    linha = (await session.exec(select(*colunas).where(Personagem.id == char_id))).first()
+    if linha is None:
+        return None
+    return serializar(linha, campos)
+
+
+def serializar(fonte, campos: Iterable[str]) -> dict:
+    """Campos de um Personagem (ou linha de select) no formato que a tela usa."""
+    resultado = {c: getattr(fonte, c) for c in campos}
+    if "avatar" in resultado:
+        resultado["avatar"] = avatars.url_avatar(resultado["avatar"])
+    return resultado
+
+
+async def alteracoes_desde(session, char_id: int, desde: int) -> Optional[dict]:
+    """{"versao", "campos", "versoes"} com o que mudou depois de 'desde'; None se a ficha não existe."""
+    stmt = select(AlteracaoCampo.campo, AlteracaoCampo.versao).where(
+        AlteracaoCampo.personagem_id == char_id,
+        AlteracaoCampo.versao > desde,
+    )
+    versoes = {campo: versao for campo, versao in (await session.exec(stmt)).all()}
+
+    atuais = await valores(session, char_id, versoes)
+    if atuais is None:
+        return None
+    # O cursor é a maior versão vista na primeira consulta, e não a versão atual
+    # da linha: algo que mude entre as duas consultas aparece no próximo pedido.
+    return {"versao": max(versoes.values(), default=desde), "campos": atuais, "versoes": versoes}
+
+
+async def apagar(session, char_id: int):
+    # No SQLite as FKs não são checadas (sem ON DELETE CASCADE) e o id pode ser reaproveitado
+    await session.execute(delete(AlteracaoCampo).where(AlteracaoCampo.personagem_id == char_id))
@@ -0,0 +1,242 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import stat
+from pathlib import Path
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # Sem brotli servimos só gzip
+    brotli = None
+
+try:
+    from PIL import Image, features as pil_features
+except ImportError:  # Sem Pillow os fundos ficam só em JPG
+    Image = None
+    pil_features = None
+
+# ==============================================================================
+# PIPELINE DE ASSETS ESTÁTICOS
+# ==============================================================================
+# Gera em static/dist/ cópias com hash no nome (css/style.3fa2c1d0.css), as
+# variantes .gz/.br dos arquivos de texto e WebP/AVIF dos fundos. Os templates
+# resolvem as URLs pelo manifest.json; como o nome muda junto com o conteúdo,
+# tudo em /static/dist/ é servido com "immutable".
+#
+# Roda sozinho no startup quando algum arquivo mudou, ou manualmente:
+#   python -m backend.assets
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATIC_DIR = BASE_DIR / "frontend" / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFESTO = DIST_DIR / "manifest.json"
+
+EXTENSOES_TEXTO = {".css", ".js", ".svg", ".json", ".html", ".txt"}
+EXTENSOES_FOTO = {".jpg", ".jpeg", ".png"}
+FUNDOS_SLIDESHOW = [
+    "img/medieval-background.jpg",
+    "img/medieval-background2.jpg",
+    "img/medieval-background3.jpg",
+    "img/medieval-background4.jpg",
+]
+
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+_manifesto = {}
+
+
+def _fontes():
+    for caminho in sorted(STATIC_DIR.rglob("*")):
+        if caminho.is_file() and DIST_DIR not in caminho.parents:
+            yield caminho.relative_to(STATIC_DIR).as_posix(), caminho
+
+
+def _gravar(destino: Path, conteudo: bytes):
+    if destino.exists():
+        return  # Nome contém o hash: se existe, é idêntico
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = destino.with_name(destino.name + f".{os.getpid()}.tmp")
+    temporario.write_bytes(conteudo)
+    os.replace(temporario, destino)
+
+
+def _comprimir(destino: Path, conteudo: bytes):
+    # mtime=0 deixa o .gz reprodutível entre builds
+    _gravar(destino.with_name(destino.name + ".gz"), gzip.compress(conteudo, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _gravar(destino.with_name(destino.name + ".br"), brotli.compress(conteudo, quality=11))
+
+
+def _converter_imagem(origem: Path, destino: Path, formato: str):
+    if destino.exists():
+        return
+    with Image.open(origem) as img:
+        img = img.convert("RGB")
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporario = destino.with_name(destino.name + f".{os.getpid()}.tmp")
+        if formato == "AVIF":
+            img.save(temporario, format="AVIF", quality=55, speed=8)
+        else:
+            img.save(temporario, format="WEBP", quality=80, method=6)
+    os.replace(temporario, destino)
+
+
+def _formatos_modernos():
+    if Image is None:
+        return []
+    formatos = [("webp", "WEBP")] if pil_features.check("webp") else []
+    if pil_features.check("avif"):
+        formatos.append(("avif", "AVIF"))
+    return formatos
+
+
+def construir() -> dict:
+    """Gera os arquivos versionados em static/dist/ e grava o manifest.json."""
+    manifesto = {}
+    formatos = _formatos_modernos()
+
+    for relativo, caminho in _fontes():
+        conteudo = caminho.read_bytes()
+        impressao = hashlib.sha256(conteudo).hexdigest()[:10]
+        versionado = f"{Path(relativo).with_suffix('').as_posix()}.{impressao}{caminho.suffix}"
+        destino = DIST_DIR / versionado
+        _gravar(destino, conteudo)
+        manifesto[relativo] = versionado
+
+        if caminho.suffix.lower() in EXTENSOES_TEXTO:
+            _comprimir(destino, conteudo)
+        elif caminho.suffix.lower() in EXTENSOES_FOTO and relativo in FUNDOS_SLIDESHOW:
+            for extensao, formato in formatos:
+                variante = destino.with_suffix(f".{extensao}")
+                try:
+                    _converter_imagem(caminho, variante, formato)
+                    manifesto[f"{relativo}@{extensao}"] = variante.relative_to(DIST_DIR).as_posix()
+                except Exception as e:
+                    logger.warning("Não foi possível gerar %s de %s: %s", extensao, relativo, e)
+
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+    temporario = MANIFESTO.with_name(f"manifest.{os.getpid()}.tmp")
+    temporario.write_text(json.dumps(manifesto, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(temporario, MANIFESTO)
+    return manifesto
+
+
+def _manifesto_atualizado() -> bool:
+    if not MANIFESTO.exists():
+        return False
+    gerado_em = MANIFESTO.stat().st_mtime
+    return all(caminho.stat().st_mtime <= gerado_em for _, caminho in _fontes())
+
+
+def carregar(reconstruir_se_preciso: bool = True) -> dict:
+    global _manifesto
+    try:
+        if reconstruir_se_preciso and not _manifesto_atualizado():
+            _manifesto = construir()
+        else:
+            _manifesto = json.loads(MANIFESTO.read_text(encoding="utf-8"))
+    except Exception:
+        # Sem manifesto o site continua funcionando com os caminhos originais
+        logger.exception("Erro no pipeline de assets, usando arquivos originais")
+        _manifesto = {}
+    return _manifesto
+
+
+def impressao_manifesto() -> str:
+    return hashlib.sha1(json.dumps(_manifesto, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def url_asset(relativo: str) -> str:
+    versionado = _manifesto.get(relativo)
+    if versionado:
+        return f"/static/dist/{versionado}"
+    return f"/static/{relativo}"
+
+
+def fundos_slideshow() -> list:
+    fundos = []
+    for relativo in FUNDOS_SLIDESHOW:
+        fundo = {"jpg": url_asset(relativo)}
+        for extensao in ("webp", "avif"):
+            variante = _manifesto.get(f"{relativo}@{extensao}")
+            if variante:
+                fundo[extensao] = f"/static/dist/{variante}"
+        fundos.append(fundo)
+    return fundos
+
+
+# ==============================================================================
+# HANDLER ESTÁTICO COM VARIANTES PRÉ-COMPRIMIDAS
+# ==============================================================================
+def codificacoes_aceitas(cabecalho: str) -> dict:
+    """{codificação: q} do Accept-Encoding ("br;q=0" recusa o br; q inválido vale 0)."""
+    aceitas = {}
+    for parte in cabecalho.split(","):
+        nome, _, parametros = parte.partition(";")
+        nome = nome.strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        for parametro in parametros.split(";"):
+            chave, _, valor = parametro.partition("=")
+            if chave.strip().lower() == "q":
+                try:
+                    q = float(valor.strip())
+                except ValueError:
+                    q = 0.0
+        aceitas[nome] = q
+    return aceitas
+
+
+class StaticComprimido(StaticFiles):
+    """StaticFiles que, em /static/dist/, serve o .br/.gz pronto e cache imutável."""
+
+    async def get_response(self, path: str, scope):
+        relativo = path.replace(os.sep, "/")
+        if not relativo.startswith("dist/"):
+            return await super().get_response(path, scope)
+
+        aceitas = codificacoes_aceitas(Headers(scope=scope).get("accept-encoding", ""))
+        curinga = aceitas.get("*", 0.0)  # Vale para as codificações não citadas
+        tipo = mimetypes.guess_type(relativo)[0] or "application/octet-stream"
+        variantes = [(aceitas.get(c, curinga), c, sufixo) for c, sufixo in (("br", ".br"), ("gzip", ".gz"))]
+        # Maior q primeiro; no empate (sort estável) o br, que é menor
+        for q, codificacao, sufixo in sorted(variantes, key=lambda v: -v[0]):
+            if not q > 0:
+                continue
+            completo, info = self.lookup_path(path + sufixo)
+            if info and stat.S_ISREG(info.st_mode):
+                return FileResponse(
+                    completo,
+                    stat_result=info,
+                    media_type=tipo,
+                    headers={
+                        "Content-Encoding": codificacao,
+                        "Vary": "Accept-Encoding",
+                        "Cache-Control": CACHE_IMUTAVEL,
+                    },
+                )
+
+        resposta = await super().get_response(path, scope)
+        if resposta.status_code in (200, 304):
+            resposta.headers["Cache-Control"] = CACHE_IMUTAVEL
+            if Path(relativo).suffix.lower() in EXTENSOES_TEXTO:
+                resposta.headers["Vary"] = "Accept-Encoding"
+        return resposta
+
+
+if __name__ == "__main__":
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    gerado = construir()
+    print(f"{len(gerado)} assets gerados em {DIST_DIR}")
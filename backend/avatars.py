@@ -0,0 +1,171 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional: sem ele servimos o original no lugar da miniatura
+    Image = None
+    ImageOps = None
+
+# ==============================================================================
+# ARMAZENAMENTO DE AVATARES (ENDEREÇADO POR CONTEÚDO)
+# ==============================================================================
+# A linha do Personagem guarda só a referência "<sha256>.<ext>"; os bytes ficam
+# em disco. Como o nome é o hash do conteúdo, o arquivo nunca muda e pode ser
+# servido com cache "immutable".
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+AVATAR_DIR = Path(os.environ.get("GIHARAD_AVATAR_DIR", BASE_DIR / "data" / "avatars"))
+
+TAMANHO_MAXIMO = 5 * 1024 * 1024  # 5 MB por upload
+TAMANHO_MINIATURA = (160, 160)    # cartas do roster têm 140px de largura
+SUFIXO_MINIATURA = ".mini.webp"
+
+TIPOS_MIDIA = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+_REF_VALIDA = re.compile(r"^[0-9a-f]{64}\.(png|jpg|gif|webp)$")
+
+
+class AvatarInvalido(ValueError):
+    pass
+
+
+def detectar_extensao(conteudo: bytes) -> Optional[str]:
+    # Confere os "magic bytes" em vez de confiar no content-type enviado pelo navegador
+    if conteudo.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if conteudo.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if conteudo[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if conteudo[:4] == b"RIFF" and conteudo[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def referencia_valida(ref: Optional[str]) -> bool:
+    return bool(ref) and bool(_REF_VALIDA.match(ref))
+
+
+def caminho_avatar(ref: str) -> Path:
+    return AVATAR_DIR / ref[:2] / ref
+
+
+def caminho_miniatura(ref: str) -> Path:
+    return AVATAR_DIR / ref[:2] / (ref.split(".")[0] + SUFIXO_MINIATURA)
+
+
+def _gravar_atomico(destino: Path, conteudo: bytes):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = destino.with_name(destino.name + f".{os.getpid()}.tmp")
+    temporario.write_bytes(conteudo)
+    os.replace(temporario, destino)
+
+
+def _gerar_miniatura(conteudo: bytes, destino: Path):
+    if Image is None:
+        return
+    try:
+        with Image.open(io.BytesIO(conteudo)) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+            img.thumbnail(TAMANHO_MINIATURA)
+            saida = io.BytesIO()
+            img.save(saida, format="WEBP", quality=80, method=4)
+        _gravar_atomico(destino, saida.getvalue())
+    except Exception:
+        logger.exception("Erro ao gerar miniatura do avatar")
+
+
+def salvar_avatar(conteudo: bytes) -> str:
+    """Grava a imagem no disco (se ainda não existir) e devolve a referência curta."""
+    if not conteudo:
+        raise AvatarInvalido("Arquivo vazio.")
+    if len(conteudo) > TAMANHO_MAXIMO:
+        raise AvatarInvalido("Imagem maior que 5 MB.")
+
+    extensao = detectar_extensao(conteudo)
+    if not extensao:
+        raise AvatarInvalido("Formato não suportado (use PNG, JPG, GIF ou WEBP).")
+
+    ref = f"{hashlib.sha256(conteudo).hexdigest()}.{extensao}"
+    original = caminho_avatar(ref)
+    if not original.exists():
+        _gravar_atomico(original, conteudo)
+
+    miniatura = caminho_miniatura(ref)
+    if not miniatura.exists():
+        _gerar_miniatura(conteudo, miniatura)
+    return ref
+
+
+def salvar_avatar_data_url(data_url: str) -> str:
+    # Formato: data:image/png;base64,AAAA...
+    try:
+        _, dados = data_url.split(",", 1)
+        return salvar_avatar(base64.b64decode(dados, validate=False))
+    except (ValueError, binascii.Error) as e:
+        raise AvatarInvalido(f"Data URL inválida: {e}")
+
+
+def url_avatar(ref: Optional[str]) -> str:
+    if not ref:
+        return ""
+    if ref.startswith("data:"):  # Legado ainda não migrado
+        return ref
+    return f"/avatars/{ref}"
+
+
+def url_miniatura(ref: Optional[str]) -> str:
+    if not ref:
+        return ""
+    if ref.startswith("data:"):
+        return ref
+    return f"/avatars/mini/{ref}"
+
+
+# ==============================================================================
+# MIGRAÇÃO DOS AVATARES BASE64 ANTIGOS
+# ==============================================================================
+def migrar_avatares_base64(session, commit: bool = True) -> int:
+    """Converte avatares salvos como data URL na coluna para arquivos em disco."""
+    # Busca só os ids primeiro: cada avatar pode ter centenas de KB
+    ids = session.exec(
+        text("SELECT id FROM personagem WHERE avatar LIKE 'data:%'")
+    ).all()
+
+    migrados = 0
+    for (char_id,) in ids:
+        data_url = session.exec(
+            text("SELECT avatar FROM personagem WHERE id = :id"), params={"id": char_id}
+        ).scalar()
+        try:
+            ref = salvar_avatar_data_url(data_url)
+        except AvatarInvalido as e:
+            logger.warning("Avatar do personagem %s ignorado: %s", char_id, e)
+            ref = ""
+        session.exec(
+            text("UPDATE personagem SET avatar = :ref WHERE id = :id"),
+            params={"ref": ref, "id": char_id},
+        )
+        migrados += 1
+
+    if migrados and commit:
+        session.commit()
+    return migrados
@@ -0,0 +1,240 @@
+import re
+import unicodedata
+from typing import Optional
+
+from sqlalchemy import text
+from sqlmodel import select
+
+from . import avatars
+from .models import Personagem
+
+# ==============================================================================
+# BUSCA NAS FICHAS (FEITIÇOS, INVENTÁRIO, HABILIDADES, NOTAS)
+# ==============================================================================
+# "Quem tem um feitiço de cura?" / "quem carrega corda?": o texto dessas
+# colunas vai para a tabela busca_ficha, uma linha por personagem, mantida
+# pelas rotas de escrita (atualizar(), na mesma transação) e refeita inteira
+# por reindexar() (migração e importação).
+#   - Postgres: colunas de texto + tsvector gerado, com índice GIN;
+#   - SQLite: tabela virtual FTS5 (rowid = id do personagem).
+# O texto é gravado sem acentos e em minúsculas: "poção" acha "Poção" e "pocao".
+
+# Ordem = pesos A, B, C, D do tsvector = colunas da FTS5
+CAMPOS_BUSCA = ("magias", "habilidades", "inventario", "notas")
+PESOS = dict(zip(CAMPOS_BUSCA, "ABCD"))
+# Relevância de cada seção (as notas contam menos que itens com nome)
+RELEVANCIA = {"magias": 1.0, "habilidades": 1.0, "inventario": 1.0, "notas": 0.5}
+
+ESCOPOS = ("minhas", "roster")
+RESULTADOS_POR_PAGINA = 20
+MAX_TERMOS = 8
+MAX_TRECHOS = 5  # Itens/linhas que casaram, por ficha
+LIMITE_TEXTO = 200_000  # Caracteres por seção (o tsvector tem limite de 1 MB)
+
+TABELA = "busca_ficha"
+
+
+class BuscaInvalida(ValueError):
+    pass
+
+
+# ==============================================================================
+# TEXTO INDEXADO
+# ==============================================================================
+def normalizar(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def _texto_item(item) -> str:
+    # Todo valor de texto do item (nome, descrição, dano...), menos o id interno
+    if isinstance(item, dict):
+        return " ".join(str(v) for k, v in item.items() if k != "id" and isinstance(v, str) and v)
+    return item if isinstance(item, str) else ""
+
+
+def linhas_secao(valor) -> list:
+    """Uma linha por item da lista (ou por linha das notas), no texto original."""
+    if not valor:
+        return []
+    if isinstance(valor, str):
+        return [linha for linha in valor.splitlines() if linha.strip()]
+    return [t for t in (_texto_item(item) for item in valor) if t]
+
+
+def texto_secao(valor) -> str:
+    return normalizar("\n".join(linhas_secao(valor)))[:LIMITE_TEXTO]
+
+
+def termos(consulta: str) -> list:
+    """Palavras da consulta (sem acento, sem operadores), no máximo MAX_TERMOS."""
+    encontrados = re.findall(r"\w+", normalizar(consulta or ""))
+    if not encontrados:
+        raise BuscaInvalida("Informe o que buscar")
+    return list(dict.fromkeys(encontrados))[:MAX_TERMOS]
+
+
+# ==============================================================================
+# ESTRUTURA (usada pela migração)
+# ==============================================================================
+def criar(conn):
+    if conn.dialect.name == "postgresql":
+        colunas = ", ".join(f"{c} TEXT NOT NULL DEFAULT ''" for c in CAMPOS_BUSCA)
+        documento = " || ".join(f"setweight(to_tsvector('simple', {c}), '{PESOS[c]}')" for c in CAMPOS_BUSCA)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {TABELA} ("
+            "personagem_id INTEGER PRIMARY KEY REFERENCES personagem (id) ON DELETE CASCADE, "
+            f"{colunas}, "
+            f"documento tsvector GENERATED ALWAYS AS ({documento}) STORED)"
+        ))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{TABELA}_documento ON {TABELA} USING GIN (documento)"))
+    else:
+        # prefix: índices extras para termos curtos digitados pela metade ("co" -> "corda")
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5("
+            f"{', '.join(CAMPOS_BUSCA)}, tokenize='unicode61', prefix='2 3')"
+        ))
+
+
+def reindexar(conn, lote: int = 500) -> int:
+    """Refaz o índice inteiro a partir da tabela personagem (conexão síncrona)."""
+    conn.execute(text(f"DELETE FROM {TABELA}"))
+    colunas = [Personagem.id] + [getattr(Personagem, c) for c in CAMPOS_BUSCA]
+    resultado = conn.execute(select(*colunas).execution_options(yield_per=lote))
+    total = 0
+    for parte in resultado.partitions():
+        registros = [{"id": linha.id, **{c: texto_secao(getattr(linha, c)) for c in CAMPOS_BUSCA}} for linha in parte]
+        conn.execute(text(_sql_inserir(conn.dialect.name, CAMPOS_BUSCA)), registros)
+        total += len(registros)
+    return total
+
+
+# ==============================================================================
+# SINCRONIZAÇÃO NAS ESCRITAS
+# ==============================================================================
+def _sql_inserir(dialeto: str, campos) -> str:
+    chave = "personagem_id" if dialeto == "postgresql" else "rowid"
+    return (
+        f"INSERT INTO {TABELA} ({chave}, {', '.join(campos)}) "
+        f"VALUES (:id, {', '.join(':' + c for c in campos)})"
+    )
+
+
+async def atualizar(session, dialeto: str, char_id: int, valores: dict):
+    """Atualiza as seções alteradas ({campo: valor novo}), na transação da escrita."""
+    campos = [c for c in CAMPOS_BUSCA if c in valores]
+    if not campos:
+        return
+    params = {"id": char_id, **{c: texto_secao(valores[c]) for c in campos}}
+
+    if dialeto == "postgresql":
+        sql = (
+            _sql_inserir(dialeto, campos)
+            + " ON CONFLICT (personagem_id) DO UPDATE SET "
+            + ", ".join(f"{c} = excluded.{c}" for c in campos)
+        )
+        await session.execute(text(sql), params)
+        return
+    # FTS5 não tem ON CONFLICT: UPDATE e, se a ficha ainda não tem linha, INSERT
+    definir = ", ".join(f"{c} = :{c}" for c in campos)
+    resultado = await session.execute(text(f"UPDATE {TABELA} SET {definir} WHERE rowid = :id"), params)
+    if resultado.rowcount == 0:
+        await session.execute(text(_sql_inserir(dialeto, campos)), params)
+
+
+async def apagar(session, dialeto: str, char_id: int):
+    # No Postgres o ON DELETE CASCADE já resolve; a FTS5 não tem chave estrangeira
+    if dialeto != "postgresql":
+        await session.execute(text(f"DELETE FROM {TABELA} WHERE rowid = :id"), {"id": char_id})
+
+
+# ==============================================================================
+# CONSULTA
+# ==============================================================================
+def ler_pedido(params) -> tuple:
+    """(termos, seções, escopo, página) a partir da query string."""
+    lista = termos(params.get("q"))
+    secoes = [s for s in (params.get("em") or "").split(",") if s]
+    for secao in secoes:
+        if secao not in CAMPOS_BUSCA:
+            raise BuscaInvalida(f"Seção inválida: {secao} (use {', '.join(CAMPOS_BUSCA)})")
+    escopo = params.get("escopo") or "minhas"
+    if escopo not in ESCOPOS:
+        raise BuscaInvalida(f"Escopo inválido: {escopo} (use {' ou '.join(ESCOPOS)})")
+    try:
+        pagina = max(int(params.get("pagina") or 1), 1)
+    except ValueError:
+        raise BuscaInvalida("Página inválida")
+    return lista, secoes or list(CAMPOS_BUSCA), escopo, pagina
+
+
+def _consulta_sql(dialeto: str, lista: list, secoes: list) -> tuple:
+    """(sql de relevância, condição de busca, parâmetro da consulta) do dialeto."""
+    if dialeto == "postgresql":
+        # Cada termo como prefixo ("cur" acha "cura"), restrito às seções pelos pesos
+        pesos = "" if len(secoes) == len(CAMPOS_BUSCA) else "".join(PESOS[s] for s in secoes)
+        consulta = " & ".join(f"{t}:*{pesos}" for t in lista)
+        # ts_rank recebe os pesos na ordem D, C, B, A
+        relevancia = "{" + ",".join(str(RELEVANCIA[c]) for c in reversed(CAMPOS_BUSCA)) + "}"
+        return (
+            f"ts_rank('{relevancia}', b.documento, to_tsquery('simple', :consulta))",
+            "b.documento @@ to_tsquery('simple', :consulta)",
+            consulta,
+        )
+    # FTS5: termos entre aspas (nada vira operador), * = prefixo, espaço = E
+    consulta = " ".join(f'"{t}"*' for t in lista)
+    if len(secoes) != len(CAMPOS_BUSCA):
+        consulta = "{" + " ".join(secoes) + "} : (" + consulta + ")"
+    # bm25 é menor quanto melhor: negado para ficar no mesmo sentido do ts_rank
+    pesos = ", ".join(str(RELEVANCIA[c]) for c in CAMPOS_BUSCA)
+    return f"-bm25({TABELA}, {pesos})", f"{TABELA} MATCH :consulta", consulta
+
+
+def consulta_busca(dialeto: str, lista: list, secoes: list, escopo: str, usuario_id: int,
+                   pagina: int = 1, por_pagina: int = RESULTADOS_POR_PAGINA):
+    """(sql, params) de uma página de ids por relevância, com uma linha a mais (ver resumos.paginar)."""
+    relevancia, condicao, consulta = _consulta_sql(dialeto, lista, secoes)
+    if escopo == "roster":
+        filtro, params = "p.is_active = :ativa", {"ativa": True}
+    else:
+        filtro, params = "p.usuario_id = :usuario_id", {"usuario_id": usuario_id}
+    juncao = "b.personagem_id" if dialeto == "postgresql" else f"{TABELA}.rowid"
+    origem = f"{TABELA} b" if dialeto == "postgresql" else TABELA
+    sql = (
+        f"SELECT p.id, {relevancia} AS relevancia "
+        f"FROM {origem} JOIN personagem p ON p.id = {juncao} "
+        f"WHERE {condicao} AND {filtro} "
+        "ORDER BY relevancia DESC, p.id LIMIT :limite OFFSET :inicio"
+    )
+    params.update(consulta=consulta, limite=por_pagina + 1, inicio=(pagina - 1) * por_pagina)
+    return text(sql), params
+
+
+def _casa(linha: str, lista: list) -> bool:
+    palavras = re.findall(r"\w+", normalizar(linha))
+    return any(p.startswith(t) for t in lista for p in palavras)
+
+
+def trechos(ficha, lista: list, secoes: list) -> list:
+    """Itens (ou linhas das notas) que casaram com algum termo, no texto original."""
+    encontrados = []
+    for secao in secoes:
+        for linha in linhas_secao(getattr(ficha, secao)):
+            if _casa(linha, lista):
+                encontrados.append({"campo": secao, "texto": linha if len(linha) <= 120 else linha[:117] + "..."})
+                if len(encontrados) >= MAX_TRECHOS:
+                    return encontrados
+    return encontrados
+
+
+def resultado(ficha, relevancia: float, username: Optional[str], lista: list, secoes: list) -> dict:
+    return {
+        "id": ficha.id,
+        "nome": ficha.nome,
+        "jogador": username or ficha.jogador or "Sem Conta",
+        "classe": ficha.classe,
+        "nivel": ficha.nivel,
+        "avatar": avatars.url_miniatura(ficha.avatar),
+        "relevancia": float(relevancia),
+        "trechos": trechos(ficha, lista, secoes),
+    }
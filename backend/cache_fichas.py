@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+# ==============================================================================
+# CACHE DA FICHA RENDERIZADA
+# ==============================================================================
+# Chave: (char_id, versao, is_owner). Como 'versao' sobe a cada escrita, uma
+# entrada nunca fica desatualizada: ela só deixa de ser pedida e sai pelo LRU.
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEMPLATE_FICHA = BASE_DIR / "frontend" / "templates" / "ficha.html"
+
+CACHE_MAX_FICHAS = int(os.environ.get("GIHARAD_CACHE_FICHAS", "128"))
+CACHE_MAX_BYTES = int(os.environ.get("GIHARAD_CACHE_FICHAS_MB", "32")) * 1024 * 1024
+
+
+def _impressao_template() -> str:
+    # Entra no ETag: um deploy com template novo invalida o cache dos navegadores
+    try:
+        return hashlib.sha1(TEMPLATE_FICHA.read_bytes()).hexdigest()[:8]
+    except OSError:
+        return "0"
+
+
+IMPRESSAO_TEMPLATE = _impressao_template()
+_impressao_assets = ""
+
+
+def definir_impressao_assets(impressao: str):
+    # A ficha aponta para CSS/JS com hash no nome: assets novos = HTML novo
+    global _impressao_assets
+    _impressao_assets = impressao
+
+
+def etag_ficha(char_id: int, versao: int, is_owner: bool) -> str:
+    return f'"f{char_id}-v{versao}-{"o" if is_owner else "s"}-{IMPRESSAO_TEMPLATE}{_impressao_assets}"'
+
+
+class CacheFichas:
+    def __init__(self, maximo: int = CACHE_MAX_FICHAS, max_bytes: int = CACHE_MAX_BYTES):
+        self._maximo = maximo
+        self._max_bytes = max_bytes
+        self._itens = OrderedDict()  # (char_id, versao, is_owner) -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def obter(self, char_id: int, versao: int, is_owner: bool) -> Optional[bytes]:
+        chave = (char_id, versao, is_owner)
+        with self._lock:
+            corpo = self._itens.get(chave)
+            if corpo is not None:
+                self._itens.move_to_end(chave)
+            return corpo
+
+    def guardar(self, char_id: int, versao: int, is_owner: bool, corpo: bytes):
+        chave = (char_id, versao, is_owner)
+        with self._lock:
+            # Versões antigas da mesma ficha nunca mais serão pedidas
+            for antiga in [k for k in self._itens if k[0] == char_id and k[2] == is_owner and k[1] != versao]:
+                self._remover(antiga)
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = corpo
+            self._bytes += len(corpo)
+            while self._itens and (len(self._itens) > self._maximo or self._bytes > self._max_bytes):
+                self._remover(next(iter(self._itens)))
+
+    def invalidar(self, char_id: int):
+        with self._lock:
+            for chave in [k for k in self._itens if k[0] == char_id]:
+                self._remover(chave)
+
+    def _remover(self, chave: Tuple):
+        self._bytes -= len(self._itens.pop(chave))
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {"entradas": len(self._itens), "bytes": self._bytes}
+
+
+cache_fichas = CacheFichas()
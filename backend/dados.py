@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import random
+import secrets
+import time
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from . import sessoes
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # Sem NumPy, rolagens e tabelas saem em Python puro (mesmo resultado)
+    np = None
+
+# ==============================================================================
+# MOTOR DE DADOS
+# ==============================================================================
+# Rolagem de atributo: d(atributo) + d(expertise) - d(incapacidade) + bônus,
+# onde expertise/incapacidade 0 = sem o dado. Os valores vêm da ficha, nunca
+# do cliente. As distribuições de cada combinação são exatas (convolução) e
+# calculadas uma vez: a tela mostra as chances sem pedir nada ao servidor.
+
+ATRIBUTOS = ("fisico", "presenca", "carisma", "astucia")
+FACES_ATRIBUTO = (4, 6, 8, 10, 12, 20)
+FACES_MINI = (0, 4, 6, 8, 10, 12)  # 0 = sem expertise/incapacidade
+MAX_ROLAGENS = 100  # por atributo, por pedido
+
+_rng = np.random.default_rng() if np is not None else random.SystemRandom()
+
+
+class PedidoInvalido(ValueError):
+    pass
+
+
+def formula(dado: int, exp: int, inc: int, bonus: int) -> str:
+    """Mesmo texto que a tela mostra no dddice: 'd8 +d4 -d6 +2'."""
+    texto = f"d{dado}"
+    if exp:
+        texto += f" +d{exp}"
+    if inc:
+        texto += f" -d{inc}"
+    if bonus > 0:
+        texto += f" +{bonus}"
+    elif bonus < 0:
+        texto += f" {bonus}"
+    return texto
+
+
+def dados_do_atributo(ficha, atributo: str) -> tuple:
+    """(dado, exp, inc, bonus) da ficha (Personagem ou linha de select)."""
+    if atributo not in ATRIBUTOS:
+        raise PedidoInvalido(f"Atributo inválido: {atributo}")
+    dado = int(getattr(ficha, atributo) or 0)
+    exp = int(getattr(ficha, f"{atributo}_exp") or 0)
+    inc = int(getattr(ficha, f"{atributo}_inc") or 0)
+    bonus = int(getattr(ficha, f"bonus_{atributo}") or 0)
+    if dado not in FACES_ATRIBUTO or exp not in FACES_MINI or inc not in FACES_MINI:
+        raise PedidoInvalido(f"Dados inválidos na ficha para {atributo}")
+    return dado, exp, inc, bonus
+
+
+def colunas_do_atributo(atributo: str) -> list:
+    """Nomes das colunas que uma rolagem do atributo lê (para selecionar só elas)."""
+    return [atributo, f"{atributo}_exp", f"{atributo}_inc", f"bonus_{atributo}"]
+
+
+# ==============================================================================
+# DISTRIBUIÇÕES
+# ==============================================================================
+def _convoluir(a: list, b: list) -> list:
+    if np is not None:
+        return np.convolve(a, b).tolist()
+    saida = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            saida[i + j] += x * y
+    return saida
+
+
+@lru_cache(maxsize=None)
+def distribuicao(dado: int, exp: int = 0, inc: int = 0) -> dict:
+    """Contagem exata de cada total (sem bônus, que só desloca a tabela).
+
+    contagens[k] = jeitos de dar 'minimo + k'; total = dado * exp * inc.
+    """
+    contagens = [1] * dado
+    minimo = 1
+    if exp:
+        contagens = _convoluir(contagens, [1] * exp)
+        minimo += 1
+    if inc:
+        # Subtrair d(inc) = somar os valores -inc..-1, também uniformes
+        contagens = _convoluir(contagens, [1] * inc)
+        minimo -= inc
+    total = sum(contagens)
+    media = sum((minimo + k) * c for k, c in enumerate(contagens)) / total
+    return {"minimo": minimo, "contagens": [int(c) for c in contagens], "total": int(total), "media": round(media, 4)}
+
+
+def chance_minima(dado: int, exp: int, inc: int, bonus: int, alvo: int) -> float:
+    """P(total >= alvo) para a rolagem com esse bônus."""
+    tabela = distribuicao(dado, exp, inc)
+    inicio = max(alvo - bonus - tabela["minimo"], 0)
+    return sum(tabela["contagens"][inicio:]) / tabela["total"]
+
+
+@lru_cache(maxsize=1)
+def tabelas_json() -> tuple:
+    """(corpo JSON, ETag) com todas as combinações; gerado uma vez por processo."""
+    tabelas = {
+        f"{dado}/{exp}/{inc}": distribuicao(dado, exp, inc)
+        for dado in FACES_ATRIBUTO for exp in FACES_MINI for inc in FACES_MINI
+    }
+    corpo = json.dumps({"status": "success", "tabelas": tabelas}, separators=(",", ":")).encode()
+    return corpo, f'"dados-{hashlib.sha1(corpo).hexdigest()[:12]}"'
+
+
+# ==============================================================================
+# ROLAGEM EM LOTE
+# ==============================================================================
+def _sortear(faces: int, quantidade: int) -> list:
+    if not faces:
+        return [0] * quantidade
+    if np is not None:
+        return _rng.integers(1, faces + 1, size=quantidade).tolist()
+    return [_rng.randint(1, faces) for _ in range(quantidade)]
+
+
+def rolar(dado: int, exp: int, inc: int, bonus: int, quantidade: int = 1) -> list:
+    """'quantidade' rolagens independentes, cada dado sorteado num vetor só."""
+    atributo = _sortear(dado, quantidade)
+    expertise = _sortear(exp, quantidade)
+    incapacidade = _sortear(inc, quantidade)
+    rolagens = []
+    for a, e, i in zip(atributo, expertise, incapacidade):
+        total = a + e - i + bonus
+        rolagens.append({
+            "atributo": a,
+            "expertise": e if exp else None,
+            "incapacidade": i if inc else None,
+            "total": total,
+            "chance": round(chance_minima(dado, exp, inc, bonus, total), 4),
+        })
+    return rolagens
+
+
+def ler_pedido(dados: dict) -> tuple:
+    """([atributos], quantidade) a partir do corpo {"atributo" | "atributos", "quantidade"}."""
+    atributos = dados.get("atributos") or [dados.get("atributo")]
+    if not isinstance(atributos, list) or not atributos or len(atributos) > len(ATRIBUTOS):
+        raise PedidoInvalido("Informe 'atributo' ou 'atributos'")
+    for atributo in atributos:
+        if atributo not in ATRIBUTOS:
+            raise PedidoInvalido(f"Atributo inválido: {atributo}")
+    try:
+        quantidade = int(dados.get("quantidade", 1))
+    except (TypeError, ValueError):
+        raise PedidoInvalido("Quantidade inválida")
+    if not 1 <= quantidade <= MAX_ROLAGENS:
+        raise PedidoInvalido(f"Quantidade deve ficar entre 1 e {MAX_ROLAGENS}")
+    return atributos, quantidade
+
+
+def auditoria(char_id: int, username: str, atributo: str, formula_texto: str, rolagens: Iterable[dict]) -> dict:
+    """Registro assinado da rolagem: o mestre confere que o resultado saiu do servidor."""
+    registro = {
+        "id": secrets.token_hex(8),
+        "em": int(time.time()),
+        "personagem_id": char_id,
+        "usuario": username,
+        "atributo": atributo,
+        "formula": formula_texto,
+        "totais": [r["total"] for r in rolagens],
+    }
+    registro["assinatura"] = sessoes.assinar_registro(registro)
+    logger.info(
+        "Rolagem %s: %s rolou %s (%s) na ficha %s = %s",
+        registro["id"], username, atributo, formula_texto, char_id, registro["totais"],
+    )
+    return registro
+
+
+def conferir_auditoria(registro: dict) -> Optional[bool]:
+    """True se a assinatura confere; None se o registro não tem assinatura."""
+    assinatura = registro.get("assinatura")
+    if not assinatura:
+        return None
+    if not isinstance(assinatura, str) or not assinatura.isascii():
+        return False  # O corpo vem do cliente: compare_digest só aceita texto ASCII
+    corpo = {k: v for k, v in registro.items() if k != "assinatura"}
+    return secrets.compare_digest(assinatura, sessoes.assinar_registro(corpo))
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Callable, Optional
+
+from sqlalchemy.engine import make_url
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# DIFUSÃO ENTRE WORKERS (LISTEN/NOTIFY)
+# ==============================================================================
+# Com vários workers do uvicorn, cada processo tem o seu roster em memória,
+# os seus long-polls de /changes e o seu cache de usuários. O que um worker
+# grava precisa chegar aos outros: os eventos vão pelo barramento local (como
+# antes) e também por aqui, num canal do Postgres (NOTIFY). Cada worker escuta
+# o canal, ignora o que ele mesmo mandou e entrega o resto aos tratadores
+# registrados (roster, fichas, usuários).
+#
+# GIHARAD_DIFUSAO:
+#   - "auto" (padrão): Postgres quando o banco é Postgres; senão desligada;
+#   - "postgres": exige o Postgres;
+#   - "memoria": entre instâncias do mesmo processo (testes);
+#   - "desligada": um worker só, nada sai do processo.
+
+CANAL = os.environ.get("GIHARAD_DIFUSAO_CANAL", "giharad_eventos")
+MODOS = ("auto", "postgres", "memoria", "desligada")
+LIMITE_PAYLOAD = 7800  # O NOTIFY aceita até 8000 bytes
+TAMANHO_FILA = 10_000
+ESPERA_RECONEXAO = (1, 2, 5, 10, 30)  # segundos
+
+eventos_difusao = metricas.registro.adicionar(metricas.Contador(
+    "giharad_difusao_eventos_total", "Eventos trocados com os outros workers", ("direcao", "tipo")))
+
+
+def modo_configurado(database_url: str) -> str:
+    modo = os.environ.get("GIHARAD_DIFUSAO", "auto").strip().lower()
+    if modo not in MODOS:
+        logger.warning("GIHARAD_DIFUSAO=%r desconhecido; usando 'auto'", modo)
+        modo = "auto"
+    if modo == "auto":
+        return "postgres" if make_url(database_url).get_backend_name() in ("postgresql", "postgres") else "desligada"
+    return modo
+
+
+def empacotar(eventos: list) -> list:
+    """Junta eventos em payloads JSON de até LIMITE_PAYLOAD bytes (um evento maior vira 'resync')."""
+    pacotes, atual, tamanho = [], [], 2
+    for evento in eventos:
+        texto = json.dumps(evento, ensure_ascii=False, separators=(",", ":"), default=str)
+        if len(texto.encode()) + 2 > LIMITE_PAYLOAD:
+            texto = json.dumps({"o": evento["o"], "t": "resync"})
+        custo = len(texto.encode()) + 1
+        if atual and tamanho + custo > LIMITE_PAYLOAD:
+            pacotes.append("[" + ",".join(atual) + "]")
+            atual, tamanho = [], 2
+        atual.append(texto)
+        tamanho += custo
+    if atual:
+        pacotes.append("[" + ",".join(atual) + "]")
+    return pacotes
+
+
+# ==============================================================================
+# TRANSPORTES
+# ==============================================================================
+class TransportePostgres:
+    """Uma conexão asyncpg dedicada: LISTEN no canal e pg_notify para enviar."""
+
+    def __init__(self, database_url: str, canal: str = CANAL):
+        url = make_url(database_url).set(drivername="postgresql")
+        self.dsn = url.render_as_string(hide_password=False)
+        self.canal = canal
+        self._conexao = None
+
+    async def conectar(self, ao_receber: Callable[[str], None], ao_cair: Callable[[], None]):
+        import asyncpg
+
+        self._conexao = await asyncpg.connect(self.dsn)
+        self._conexao.add_termination_listener(lambda _conexao: ao_cair())
+        await self._conexao.add_listener(self.canal, lambda _c, _pid, _canal, payload: ao_receber(payload))
+
+    async def enviar(self, payload: str):
+        await self._conexao.execute("SELECT pg_notify($1, $2)", self.canal, payload)
+
+    async def fechar(self):
+        if self._conexao is not None:
+            conexao, self._conexao = self._conexao, None
+            await conexao.close()
+
+
+class TransporteMemoria:
+    """Substituto do Postgres para testes: entrega para as outras instâncias do processo."""
+
+    _conectados = []
+
+    def __init__(self):
+        self._ao_receber = None
+
+    async def conectar(self, ao_receber, ao_cair):
+        self._ao_receber = ao_receber
+        TransporteMemoria._conectados.append(self)
+
+    async def enviar(self, payload: str):
+        for outro in list(TransporteMemoria._conectados):
+            if outro is not self:
+                outro._ao_receber(payload)
+
+    async def fechar(self):
+        if self in TransporteMemoria._conectados:
+            TransporteMemoria._conectados.remove(self)
+
+
+# ==============================================================================
+# DIFUSÃO
+# ==============================================================================
+class Difusao:
+    def __init__(self):
+        self.origem = uuid.uuid4().hex[:12]  # Identifica este worker nas mensagens
+        self._tratadores = {}  # tipo -> [funcao(dados), ...]
+        self._transporte = None
+        self._fila = None
+        self._loop = None
+        self._tarefa = None
+        self._caiu = None
+
+    @property
+    def ativa(self) -> bool:
+        return self._tarefa is not None
+
+    def tratador(self, tipo: str):
+        """Decorador: função chamada com os dados de cada evento 'tipo' vindo de outro worker."""
+        def registrar(funcao):
+            self._tratadores.setdefault(tipo, []).append(funcao)
+            return funcao
+        return registrar
+
+    # --------------------------------------------------------------------------
+    # Ciclo de vida (lifespan do FastAPI)
+    # --------------------------------------------------------------------------
+    async def iniciar(self, database_url: str, transporte=None):
+        if transporte is None:
+            modo = modo_configurado(database_url)
+            if modo == "desligada":
+                return
+            transporte = TransportePostgres(database_url) if modo == "postgres" else TransporteMemoria()
+        self._transporte = transporte
+        self._loop = asyncio.get_running_loop()
+        self._fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        self._caiu = asyncio.Event()
+        try:
+            await self._conectar()
+        except Exception:
+            # O site sobe mesmo assim; o laço tenta de novo em seguida
+            logger.exception("Difusão entre workers indisponível no startup")
+            self._caiu.set()
+        self._tarefa = asyncio.create_task(self._laco())
+        logger.info("Difusão entre workers ligada (%s, origem %s)", type(transporte).__name__, self.origem)
+
+    async def parar(self):
+        if self._tarefa is None:
+            return
+        self._tarefa.cancel()
+        try:
+            await self._tarefa
+        except asyncio.CancelledError:
+            pass
+        self._tarefa = None
+        await self._transporte.fechar()
+
+    async def _conectar(self):
+        self._caiu.clear()
+        await self._transporte.conectar(self._receber, lambda: self._loop.call_soon_threadsafe(self._cair))
+
+    def _cair(self):
+        # Conexão perdida: acorda o laço mesmo sem nada na fila (None = só acordar)
+        self._caiu.set()
+        self._enfileirar(None)
+
+    # --------------------------------------------------------------------------
+    # Envio
+    # --------------------------------------------------------------------------
+    def enviar(self, tipo: str, dados: dict):
+        """Agenda o evento para os outros workers. Não bloqueia; sem difusão, não faz nada."""
+        if self._tarefa is None:
+            return
+        evento = {"o": self.origem, "t": tipo, "d": dados}
+        try:
+            em_outro_loop = asyncio.get_running_loop() is not self._loop
+        except RuntimeError:
+            em_outro_loop = True  # Thread do threadpool
+        if em_outro_loop:
+            self._loop.call_soon_threadsafe(self._enfileirar, evento)
+        else:
+            self._enfileirar(evento)
+
+    def _enfileirar(self, evento: dict):
+        try:
+            self._fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            if evento is not None:
+                logger.warning("Fila da difusão cheia; evento %s descartado", evento["t"])
+
+    async def _laco(self):
+        tentativa = 0
+        eventos = []  # Lote atual; fica para depois da reconexão se o envio falhar
+        while True:
+            try:
+                if self._caiu.is_set():
+                    await self._transporte.fechar()
+                    await self._conectar()
+                    # Algo pode ter passado enquanto estava desconectado, nos dois sentidos
+                    self._tratar("resync", {})
+                    self._enfileirar({"o": self.origem, "t": "resync", "d": {}})
+                    tentativa = 0
+                if not eventos:
+                    eventos = [await self._fila.get()]
+                    while not self._fila.empty():
+                        eventos.append(self._fila.get_nowait())
+                    eventos = [e for e in eventos if e is not None]
+                    if self._caiu.is_set() or not eventos:
+                        continue
+                for payload in empacotar(eventos):
+                    await self._transporte.enviar(payload)
+                for evento in eventos:
+                    eventos_difusao.inc(("enviado", evento["t"]))
+                eventos = []
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                espera = ESPERA_RECONEXAO[min(tentativa, len(ESPERA_RECONEXAO) - 1)]
+                logger.exception("Difusão entre workers falhou; reconectando em %ss", espera)
+                self._caiu.set()
+                tentativa += 1
+                await asyncio.sleep(espera)
+
+    # --------------------------------------------------------------------------
+    # Recebimento
+    # --------------------------------------------------------------------------
+    def _receber(self, payload: str):
+        try:
+            eventos = json.loads(payload)
+        except ValueError:
+            logger.warning("Payload inválido no canal de difusão")
+            return
+        for evento in eventos:
+            if evento.get("o") == self.origem:
+                continue  # O próprio worker já aplicou localmente
+            eventos_difusao.inc(("recebido", evento.get("t")))
+            self._tratar(evento.get("t"), evento.get("d") or {})
+
+    def _tratar(self, tipo: Optional[str], dados: dict):
+        for funcao in self._tratadores.get(tipo, ()):
+            try:
+                funcao(dados)
+            except Exception:
+                logger.exception("Erro ao aplicar evento %s de outro worker", tipo)
+
+
+difusao = Difusao()
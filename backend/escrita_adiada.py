@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import update
+from sqlmodel import select
+
+from . import alteracoes
+from .models import Personagem
+from .roster import roster
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# ESCRITA ADIADA DOS CONTADORES (WRITE-BEHIND)
+# ==============================================================================
+# Em combate cada clique em PV/PA/PH/PG ou num espaço de feitiço vira um
+# save. Só esses contadores passam por aqui: o valor fica numa cópia em
+# memória (o último clique de cada campo vence), o roster é avisado na hora e
+# uma tarefa grava tudo de tempos em tempos, um UPDATE por ficha alterada,
+# numa transação só. O resto da ficha continua sendo gravado na hora.
+#
+# Durabilidade (GIHARAD_ESCRITA_ADIADA):
+#   - "memoria" (padrão): a resposta sai antes do banco; uma queda do processo
+#     perde no máximo GIHARAD_ESCRITA_ADIADA_MS de cliques. Desligar o servidor
+#     normalmente (Ctrl+C) grava tudo antes de sair.
+#   - "desligada": todo clique é gravado antes da resposta, como antes.
+# Cada worker tem a sua cópia, que os outros não enxergam: eles leriam
+# contadores velhos e a gravação atrasada atropelaria o que gravassem depois
+# (um descanso longo desfeito por um clique anterior). Por isso, com a difusão
+# entre workers ligada (GIHARAD_DIFUSAO; o padrão no Postgres), a escrita
+# adiada fica desligada. Um worker só no Postgres: GIHARAD_DIFUSAO=desligada.
+
+MODOS = ("memoria", "desligada")
+MODO = os.environ.get("GIHARAD_ESCRITA_ADIADA", "memoria").strip().lower()
+if MODO not in MODOS:
+    logger.warning("GIHARAD_ESCRITA_ADIADA=%r desconhecido; usando 'memoria'", MODO)
+    MODO = "memoria"
+INTERVALO = int(os.environ.get("GIHARAD_ESCRITA_ADIADA_MS", "500")) / 1000
+# Com mais fichas pendentes que isso, grava sem esperar o intervalo
+MAXIMO_PENDENTES = int(os.environ.get("GIHARAD_ESCRITA_ADIADA_MAX", "200"))
+
+CAMPOS_CONTADORES = frozenset(
+    ["pv_atual", "pa_atual", "ph_atual", "pg_atual"]
+    + [f"slots_nv{i}" for i in range(1, 7)]
+    + ["marcadores_morte", "marcadores_fadiga", "marcadores_cicatrizes"]
+)
+
+MAXIMO_DONOS = 4096  # Cache char_id -> usuario_id (dono de uma ficha não muda)
+
+
+class EscritaAdiada:
+    def __init__(self, intervalo: float = INTERVALO, maximo: int = MAXIMO_PENDENTES, ativa: bool = MODO == "memoria"):
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self.ativa = ativa and intervalo > 0
+        self._pendentes = {}  # char_id -> {campo: valor}
+        self._abas = {}  # char_id -> {campo: aba do último clique} (ver alteracoes.conflitos)
+        self._donos = {}
+        self._lock = threading.Lock()
+        self._descarga = None  # asyncio.Lock: uma gravação por vez mantém a ordem dos cliques
+        self._acordar = None
+        self._tarefa = None
+        self._fabrica = None
+        self._dialeto = None
+
+    # --------------------------------------------------------------------------
+    # Ciclo de vida (lifespan do FastAPI)
+    # --------------------------------------------------------------------------
+    def iniciar(self, fabrica_sessao, dialeto: str, varios_workers: bool = False):
+        self._fabrica = fabrica_sessao
+        self._dialeto = dialeto
+        if varios_workers and self.ativa:
+            logger.info("Difusão entre workers ligada: contadores gravados a cada clique")
+            self.ativa = False
+        self._descarga = asyncio.Lock()
+        self._acordar = asyncio.Event()
+        if self.ativa:
+            self._tarefa = asyncio.create_task(self._laco())
+
+    async def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        if self._fabrica:
+            await self.descarregar()
+
+    async def _laco(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+            try:
+                await self.descarregar()
+            except Exception:
+                logger.exception("Erro ao gravar contadores pendentes")
+                await asyncio.sleep(self.intervalo)  # Banco fora: não gira em falso
+
+    # --------------------------------------------------------------------------
+    # Escrita
+    # --------------------------------------------------------------------------
+    def aceita(self, campos) -> bool:
+        """Só saves compostos apenas de contadores são adiados."""
+        return self.ativa and self._tarefa is not None and bool(campos) and all(c in CAMPOS_CONTADORES for c in campos)
+
+    def dono(self, char_id: int) -> Optional[int]:
+        with self._lock:
+            return self._donos.get(char_id)
+
+    def lembrar_dono(self, char_id: int, usuario_id: int):
+        with self._lock:
+            if len(self._donos) >= MAXIMO_DONOS:
+                self._donos.clear()
+            self._donos[char_id] = usuario_id
+
+    def registrar(self, char_id: int, campos: dict, aba: Optional[str] = None):
+        """Aplica na cópia em memória; a gravação sai no próximo ciclo."""
+        with self._lock:
+            self._pendentes.setdefault(char_id, {}).update(campos)
+            self._abas.setdefault(char_id, {}).update(dict.fromkeys(campos, aba))
+            cheio = len(self._pendentes) >= self.maximo
+        roster.alterar(char_id, campos)
+        if cheio:
+            self._acordar.set()
+
+    def pendentes(self, char_id: int) -> dict:
+        with self._lock:
+            return dict(self._pendentes.get(char_id, {}))
+
+    def total_pendentes(self) -> int:
+        with self._lock:
+            return len(self._pendentes)
+
+    def descartar(self, char_id: int):
+        # Ficha apagada: nada a gravar e o id não pertence mais a ninguém
+        with self._lock:
+            self._pendentes.pop(char_id, None)
+            self._abas.pop(char_id, None)
+            self._donos.pop(char_id, None)
+
+    async def descarregar(self, char_id: Optional[int] = None):
+        """Grava o que está pendente (de uma ficha, ou de todas). Antes de ler a ficha do banco."""
+        if self._descarga is None:
+            return
+        async with self._descarga:
+            with self._lock:
+                if char_id is None:
+                    lote, self._pendentes = self._pendentes, {}
+                    abas, self._abas = self._abas, {}
+                elif char_id in self._pendentes:
+                    lote = {char_id: self._pendentes.pop(char_id)}
+                    abas = {char_id: self._abas.pop(char_id, {})}
+                else:
+                    lote, abas = {}, {}
+            if not lote:
+                return
+            try:
+                versoes = await self._gravar(lote, abas)
+            except BaseException:
+                # Devolve para a fila (inclusive se cancelada no desligamento) sem
+                # atropelar cliques que chegaram durante a tentativa
+                with self._lock:
+                    for cid, campos in lote.items():
+                        self._pendentes[cid] = {**campos, **self._pendentes.get(cid, {})}
+                        self._abas[cid] = {**abas.get(cid, {}), **self._abas.get(cid, {})}
+                raise
+        # O roster já recebeu estes valores em registrar()
+        for cid, versao in versoes.items():
+            alteracoes.publicar(cid, versao)
+
+    async def _gravar(self, lote: dict, abas: dict) -> dict:
+        inicio = time.perf_counter()
+        versoes = {}
+        async with self._fabrica() as session:
+            for cid, campos in lote.items():
+                stmt = update(Personagem).where(Personagem.id == cid).values(**campos).returning(Personagem.versao)
+                versao = (await session.execute(stmt)).scalar()
+                if versao is None:
+                    continue  # Apagada enquanto esperava
+                # Cada campo fica com a aba do último clique nele
+                por_aba = {}
+                for campo in campos:
+                    por_aba.setdefault(abas.get(cid, {}).get(campo), []).append(campo)
+                for aba, grupo in por_aba.items():
+                    await alteracoes.registrar(session, self._dialeto, cid, grupo, versao, aba)
+                versoes[cid] = versao
+            await session.commit()
+        logger.debug("%s ficha(s) gravadas em %.1f ms", len(versoes), (time.perf_counter() - inicio) * 1000)
+        return versoes
+
+
+async def dono_da_ficha(session, char_id: int) -> Optional[int]:
+    """usuario_id da ficha, sem ir ao banco depois da primeira vez."""
+    usuario_id = escrita_adiada.dono(char_id)
+    if usuario_id is None:
+        usuario_id = (await session.exec(select(Personagem.usuario_id).where(Personagem.id == char_id))).first()
+        if usuario_id is not None:
+            escrita_adiada.lembrar_dono(char_id, usuario_id)
+    return usuario_id
+
+
+escrita_adiada = EscritaAdiada()
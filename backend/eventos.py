@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+# ==============================================================================
+# BARRAMENTO DE EVENTOS EM PROCESSO
+# ==============================================================================
+# As rotas síncronas rodam no threadpool do FastAPI, então a publicação precisa
+# ser thread-safe: cada assinante guarda o loop dele e recebe os eventos via
+# call_soon_threadsafe. Um único publicar() atende todos os clientes conectados.
+
+TAMANHO_FILA = 256
+
+
+class Barramento:
+    def __init__(self):
+        self._assinantes = {}  # topico -> set de (loop, fila)
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def assinar(self, topico: str):
+        loop = asyncio.get_running_loop()
+        fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        entrada = (loop, fila)
+        with self._lock:
+            self._assinantes.setdefault(topico, set()).add(entrada)
+        try:
+            yield fila
+        finally:
+            with self._lock:
+                assinantes = self._assinantes.get(topico)
+                if assinantes:
+                    assinantes.discard(entrada)
+                    if not assinantes:
+                        del self._assinantes[topico]
+
+    def publicar(self, topico: str, evento: dict):
+        with self._lock:
+            assinantes = list(self._assinantes.get(topico, ()))
+        for loop, fila in assinantes:
+            try:
+                loop.call_soon_threadsafe(_entregar, fila, evento)
+            except RuntimeError:
+                pass  # Loop já encerrado (cliente desconectando)
+
+    def total_assinantes(self, topico: str) -> int:
+        with self._lock:
+            return len(self._assinantes.get(topico, ()))
+
+
+def _entregar(fila: asyncio.Queue, evento: dict):
+    try:
+        fila.put_nowait(evento)
+    except asyncio.QueueFull:
+        # Cliente lento demais: em vez de crescer sem limite, pedimos que ele
+        # refaça o snapshot completo.
+        while not fila.empty():
+            fila.get_nowait()
+        fila.put_nowait({"tipo": "resync"})
+
+
+barramento = Barramento()
@@ -0,0 +1,207 @@
+"""Exporta e importa usuários e fichas em NDJSON, em memória constante.
+
+    python -m backend.exportacao exportar campanha.ndjson.gz
+    python -m backend.exportacao importar campanha.ndjson.gz
+
+Cada linha é um registro ({"tipo": "usuario" | "personagem" | "avatar", ...}),
+então o arquivo nunca é montado inteiro: a exportação lê o banco em lotes
+(cursor no servidor no Postgres) e a importação grava em INSERTs de várias
+linhas por lote. Terminar em .gz liga a compressão; "-" usa stdin/stdout.
+"""
+import argparse
+import base64
+import gzip
+import io
+import json
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import func, insert, select, text
+
+from . import avatars, busca, historico, migracoes
+from .models import AlteracaoCampo, Personagem, Usuario
+
+FORMATO = "giharad-ndjson"
+VERSAO_FORMATO = 1
+TAMANHO_LOTE = 500
+
+# Ordem importa na importação: o personagem aponta para o usuário
+TABELAS = (("usuario", Usuario.__table__), ("personagem", Personagem.__table__))
+
+
+class ArquivoInvalido(ValueError):
+    pass
+
+
+def abrir(caminho: str, modo: str):
+    """Arquivo texto UTF-8; .gz é (des)comprimido no caminho, '-' é stdin/stdout."""
+    if caminho == "-":
+        fluxo = sys.stdout.buffer if modo == "w" else sys.stdin.buffer
+        if modo == "w":
+            return io.TextIOWrapper(fluxo, encoding="utf-8", write_through=True)
+        return io.TextIOWrapper(fluxo, encoding="utf-8")
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, modo + "t", encoding="utf-8", compresslevel=6)
+    return open(caminho, modo, encoding="utf-8")
+
+
+def _linha(registro: dict) -> str:
+    return json.dumps(registro, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+
+# ==============================================================================
+# EXPORTAÇÃO
+# ==============================================================================
+def exportar(engine, saida, com_avatares: bool = True, lote: int = TAMANHO_LOTE) -> dict:
+    """Escreve cabeçalho, usuários, fichas e (opcional) avatares. Devolve as contagens."""
+    contagem = {nome: 0 for nome, _ in TABELAS}
+    contagem["avatar"] = 0
+    saida.write(_linha({
+        "tipo": "cabecalho",
+        "formato": FORMATO,
+        "versao": VERSAO_FORMATO,
+        "schema": migracoes.versao_final(),
+        "em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }))
+
+    # stream_results: cursor nomeado no psycopg2 (o Postgres manda aos poucos);
+    # yield_per: o SQLAlchemy busca e entrega 'lote' linhas por vez
+    with engine.connect().execution_options(stream_results=True, yield_per=lote) as conn:
+        refs = set()
+        for nome, tabela in TABELAS:
+            resultado = conn.execute(select(tabela).order_by(tabela.c.id))
+            for linha in resultado.mappings():
+                saida.write(_linha({"tipo": nome, "dados": dict(linha)}))
+                contagem[nome] += 1
+                if nome == "personagem" and avatars.referencia_valida(linha["avatar"]):
+                    refs.add(linha["avatar"])
+
+    if com_avatares:
+        # Só as referências (64 caracteres cada) ficam em memória, uma imagem por vez
+        for ref in sorted(refs):
+            caminho = avatars.caminho_avatar(ref)
+            if not caminho.exists():
+                continue
+            saida.write(_linha({"tipo": "avatar", "ref": ref, "conteudo": base64.b64encode(caminho.read_bytes()).decode()}))
+            contagem["avatar"] += 1
+    return contagem
+
+
+# ==============================================================================
+# IMPORTAÇÃO
+# ==============================================================================
+def _ler(entrada):
+    for numero, linha in enumerate(entrada, 1):
+        if not linha.strip():
+            continue
+        try:
+            yield json.loads(linha)
+        except ValueError:
+            raise ArquivoInvalido(f"Linha {numero} não é JSON válido")
+
+
+def _ajustar_sequencias(conn):
+    # Os ids vieram do arquivo: o próximo INSERT do Postgres tem que começar depois deles
+    if conn.dialect.name != "postgresql":
+        return
+    for _, tabela in TABELAS:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{tabela.name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {tabela.name}), 0) + 1, false)"
+        ))
+
+
+def importar(engine, entrada, substituir: bool = False, lote: int = TAMANHO_LOTE) -> dict:
+    """Grava o arquivo num banco vazio (ou limpa antes, com substituir=True), numa transação só."""
+    migracoes.migrar(engine)
+    registros = _ler(entrada)
+    cabecalho = next(registros, None)
+    if not cabecalho or cabecalho.get("tipo") != "cabecalho" or cabecalho.get("formato") != FORMATO:
+        raise ArquivoInvalido("Arquivo não é uma exportação do Giharad")
+    if cabecalho.get("versao", 0) > VERSAO_FORMATO:
+        raise ArquivoInvalido("Exportação feita por uma versão mais nova do sistema")
+
+    tabelas = dict(TABELAS)
+    contagem = {nome: 0 for nome in tabelas}
+    contagem["avatar"] = 0
+    pendentes = {nome: [] for nome in tabelas}
+
+    def gravar(nome):
+        if pendentes[nome]:
+            # Lista de dicts: o SQLAlchemy agrupa em INSERT ... VALUES (...), (...) por lote
+            conn.execute(insert(tabelas[nome]), pendentes[nome])
+            contagem[nome] += len(pendentes[nome])
+            pendentes[nome] = []
+
+    with engine.begin() as conn:
+        existentes = sum(conn.execute(select(func.count()).select_from(t)).scalar() for t in tabelas.values())
+        if existentes and not substituir:
+            raise ArquivoInvalido("O banco já tem dados; use --substituir para apagar antes de importar")
+        if substituir:
+            conn.execute(AlteracaoCampo.__table__.delete())
+            for _, tabela in reversed(TABELAS):
+                conn.execute(tabela.delete())
+
+        for registro in registros:
+            tipo = registro.get("tipo")
+            if tipo in tabelas:
+                tabela = tabelas[tipo]
+                # Colunas que não existem mais são ignoradas; as novas ficam com o padrão
+                pendentes[tipo].append({k: v for k, v in registro["dados"].items() if k in tabela.c})
+                if tipo == "personagem":
+                    gravar("usuario")  # O dono precisa estar gravado antes da ficha
+                if len(pendentes[tipo]) >= lote:
+                    gravar(tipo)
+            elif tipo == "avatar":
+                conteudo = base64.b64decode(registro["conteudo"])
+                if avatars.salvar_avatar(conteudo) != registro["ref"]:
+                    raise ArquivoInvalido(f"Avatar {registro['ref']} corrompido")
+                contagem["avatar"] += 1
+            else:
+                raise ArquivoInvalido(f"Registro de tipo desconhecido: {tipo}")
+
+        for nome in tabelas:
+            gravar(nome)
+        _ajustar_sequencias(conn)
+        busca.reindexar(conn, lote)
+        historico.recriar(conn, lote)  # O histórico não vai no arquivo: começa de um snapshot
+    return contagem
+
+
+# ==============================================================================
+# LINHA DE COMANDO
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Exportação/importação de usuários e fichas (NDJSON)")
+    sub = parser.add_subparsers(dest="modo", required=True)
+
+    p_exportar = sub.add_parser("exportar", help="Banco -> arquivo")
+    p_exportar.add_argument("arquivo", help="Destino (.ndjson, .ndjson.gz ou - para stdout)")
+    p_exportar.add_argument("--sem-avatares", action="store_true", help="Não inclui as imagens dos avatares")
+
+    p_importar = sub.add_parser("importar", help="Arquivo -> banco")
+    p_importar.add_argument("arquivo", help="Origem (.ndjson, .ndjson.gz ou - para stdin)")
+    p_importar.add_argument("--substituir", action="store_true", help="Apaga usuários e fichas existentes antes")
+
+    for p in (p_exportar, p_importar):
+        p.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Linhas por leitura/INSERT")
+    args = parser.parse_args()
+
+    from .database import engine
+
+    try:
+        if args.modo == "exportar":
+            with abrir(args.arquivo, "w") as saida:
+                contagem = exportar(engine, saida, com_avatares=not args.sem_avatares, lote=args.lote)
+        else:
+            with abrir(args.arquivo, "r") as entrada:
+                contagem = importar(engine, entrada, substituir=args.substituir, lote=args.lote)
+    except (ArquivoInvalido, avatars.AvatarInvalido) as e:
+        sys.exit(f"Erro: {e}")  # A importação roda numa transação: nada foi gravado
+    resumo = ", ".join(f"{n} {tipo}(s)" for tipo, n in contagem.items())
+    # Em stdout iria para dentro do arquivo exportado
+    print(f"{args.modo.capitalize()}: {resumo}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, insert
+from sqlmodel import select
+
+from . import alteracoes
+from .escrita_adiada import CAMPOS_CONTADORES
+from .models import HistoricoFicha, Personagem
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# HISTÓRICO DA FICHA (DELTAS + SNAPSHOTS, DESFAZER/REFAZER)
+# ==============================================================================
+# Cada escrita acrescenta uma linha "delta" com só os campos gravados e seus
+# novos valores (um INSERT a mais na mesma transação). O estado completo fica
+# em linhas "snapshot": uma na criação da ficha e outras que a compactação
+# intercala a cada SNAPSHOT_A_CADA deltas. Assim:
+#   - o estado numa versão = snapshot anterior + no máximo SNAPSHOT_A_CADA deltas;
+#   - a compactação apaga o que vem antes de um snapshot quando a ficha passa
+#     de MAX_DELTAS deltas (o snapshot vira a nova base);
+#   - desfazer grava, como um delta novo, os valores de antes da última edição.
+# Contadores (PV/PA atuais, espaços, marcadores) mudam a cada clique em combate
+# e ficam de fora, assim como ficha ativa e avatar.
+
+SNAPSHOT_A_CADA = int(os.environ.get("GIHARAD_HISTORICO_SNAPSHOT", "50"))
+MAX_DELTAS = int(os.environ.get("GIHARAD_HISTORICO_MAX", "500"))
+POR_PAGINA = 50
+
+IGNORADOS = {"is_active", "avatar"}
+CAMPOS_HISTORICO = tuple(
+    c for c in Personagem.__table__.columns.keys()
+    if alteracoes.campo_sincronizado(c) and c not in CAMPOS_CONTADORES and c not in IGNORADOS
+)
+
+ACOES = ("desfazer", "refazer")
+
+
+class HistoricoIndisponivel(ValueError):
+    pass
+
+
+def filtrar(valores: dict) -> dict:
+    return {c: v for c, v in valores.items() if c in CAMPOS_HISTORICO}
+
+
+def estado_de(fonte) -> dict:
+    """Campos do histórico de um Personagem (ou linha de select)."""
+    return {c: getattr(fonte, c) for c in CAMPOS_HISTORICO}
+
+
+# ==============================================================================
+# ESCRITA
+# ==============================================================================
+async def registrar(session, char_id: int, versao: int, valores: dict,
+                    origem: str = "edicao", alvo: Optional[int] = None) -> bool:
+    """Acrescenta o delta da escrita (na transação dela). False se nada entra no histórico."""
+    campos = filtrar(valores)
+    if not campos:
+        return False
+    session.add(HistoricoFicha(
+        personagem_id=char_id, versao=versao, tipo="delta", origem=origem, alvo=alvo, campos=campos,
+    ))
+    return True
+
+
+def base(session, personagem: Personagem):
+    # Ficha nova: o primeiro snapshot é o ponto de partida de todo desfazer
+    session.add(HistoricoFicha(
+        personagem_id=personagem.id, versao=personagem.versao, tipo="snapshot", campos=estado_de(personagem),
+    ))
+
+
+async def apagar(session, char_id: int):
+    # No SQLite as FKs não são checadas (sem ON DELETE CASCADE)
+    await session.execute(delete(HistoricoFicha).where(HistoricoFicha.personagem_id == char_id))
+
+
+def recriar(conn, lote: int = 500) -> int:
+    """Apaga o histórico e grava um snapshot de cada ficha (conexão síncrona)."""
+    conn.execute(delete(HistoricoFicha))
+    colunas = [Personagem.id, Personagem.versao] + [getattr(Personagem, c) for c in CAMPOS_HISTORICO]
+    resultado = conn.execute(select(*colunas).execution_options(yield_per=lote))
+    agora = datetime.now(timezone.utc).replace(tzinfo=None)
+    total = 0
+    for parte in resultado.partitions():
+        conn.execute(insert(HistoricoFicha.__table__), [
+            {"personagem_id": linha.id, "versao": linha.versao, "tipo": "snapshot",
+             "origem": "edicao", "em": agora, "campos": estado_de(linha)}
+            for linha in parte
+        ])
+        total += len(parte)
+    return total
+
+
+# ==============================================================================
+# LEITURA
+# ==============================================================================
+async def estado_em(session, char_id: int, versao: int) -> Optional[dict]:
+    """Campos do histórico como estavam na versão; None se ela já foi compactada."""
+    H = HistoricoFicha
+    snapshot = (await session.execute(
+        select(H.versao, H.campos)
+        .where(H.personagem_id == char_id, H.tipo == "snapshot", H.versao <= versao)
+        .order_by(H.versao.desc()).limit(1)
+    )).first()
+    if snapshot is None:
+        return None
+    estado = dict(snapshot.campos)
+    deltas = await session.execute(
+        select(H.campos)
+        .where(H.personagem_id == char_id, H.tipo == "delta", H.versao > snapshot.versao, H.versao <= versao)
+        .order_by(H.versao)
+    )
+    for (campos,) in deltas:
+        estado.update(campos)
+    return estado
+
+
+async def pilhas(session, char_id: int) -> tuple:
+    """(desfazer, refazer): ids das entradas, a do topo no fim de cada lista."""
+    H = HistoricoFicha
+    linhas = await session.execute(
+        select(H.id, H.origem, H.alvo).where(H.personagem_id == char_id, H.tipo == "delta").order_by(H.versao)
+    )
+    desfazer, refazer = [], []
+    for linha in linhas:
+        if linha.origem == "desfazer":
+            if linha.alvo in desfazer:
+                desfazer.remove(linha.alvo)
+                refazer.append(linha.alvo)
+        elif linha.origem == "refazer":
+            if linha.alvo in refazer:
+                refazer.remove(linha.alvo)
+                desfazer.append(linha.alvo)
+        else:
+            # Edição nova invalida o que estava para refazer
+            desfazer.append(linha.id)
+            refazer.clear()
+    return desfazer, refazer
+
+
+async def planejar(session, char_id: int, acao: str) -> tuple:
+    """(id da entrada alvo, {campo: valor} a gravar) para desfazer ou refazer."""
+    desfazer, refazer = await pilhas(session, char_id)
+    pilha = desfazer if acao == "desfazer" else refazer
+    if not pilha:
+        raise HistoricoIndisponivel("Nada para desfazer" if acao == "desfazer" else "Nada para refazer")
+    entrada = await session.get(HistoricoFicha, pilha[-1])
+    if acao == "refazer":
+        return entrada.id, filtrar(entrada.campos)
+
+    anterior = await estado_em(session, char_id, entrada.versao - 1)
+    if anterior is None:
+        raise HistoricoIndisponivel("O histórico anterior a esta alteração já foi compactado")
+    valores = {c: anterior[c] for c in entrada.campos if c in anterior}
+    if not valores:
+        raise HistoricoIndisponivel("Nada para desfazer")
+    return entrada.id, valores
+
+
+async def listar(session, char_id: int, antes: Optional[int] = None, limite: int = POR_PAGINA) -> list:
+    """Entradas mais recentes primeiro (só os nomes dos campos), paginadas por versão."""
+    H = HistoricoFicha
+    stmt = select(H).where(H.personagem_id == char_id)
+    if antes is not None:
+        stmt = stmt.where(H.versao < antes)
+    entradas = (await session.exec(stmt.order_by(H.versao.desc(), H.tipo.desc()).limit(limite))).all()
+    return [
+        {
+            "id": e.id,
+            "versao": e.versao,
+            "tipo": e.tipo,
+            "origem": e.origem,
+            "alvo": e.alvo,
+            "em": e.em.isoformat(timespec="seconds"),
+            "campos": sorted(e.campos) if e.tipo == "delta" else [],
+        }
+        for e in entradas
+    ]
+
+
+# ==============================================================================
+# COMPACTAÇÃO
+# ==============================================================================
+async def compactar(session, char_id: int, a_cada: int = SNAPSHOT_A_CADA, maximo: int = MAX_DELTAS) -> dict:
+    """Intercala snapshots a cada 'a_cada' deltas e poda o que passar de 'maximo'."""
+    H = HistoricoFicha
+    # Trava a ficha: escritas e outra compactação da mesma ficha esperam
+    await session.execute(select(Personagem.id).where(Personagem.id == char_id).with_for_update())
+    # "delta" < "snapshot": na mesma versão o snapshot vem depois (já inclui o delta)
+    ordem = (H.versao, H.tipo)
+    metas = (await session.execute(
+        select(H.id, H.versao, H.tipo).where(H.personagem_id == char_id).order_by(*ordem)
+    )).all()
+
+    # 1. Snapshots novos: onde já há 'a_cada' deltas desde o último
+    novos, desde, ultimo_snapshot = [], 0, None
+    for meta in metas:
+        if meta.tipo == "snapshot":
+            desde = 0
+            if not novos:
+                ultimo_snapshot = meta.versao
+            continue
+        desde += 1
+        if desde >= a_cada:
+            novos.append(meta.versao)
+            desde = 0
+    if novos and ultimo_snapshot is not None:
+        # Um único passe: parte do último snapshot e vai aplicando os deltas
+        linhas = await session.execute(
+            select(H.versao, H.tipo, H.campos)
+            .where(H.personagem_id == char_id, H.versao >= ultimo_snapshot, H.versao <= novos[-1])
+            .order_by(*ordem)
+        )
+        estado, pendentes = {}, list(novos)
+        for linha in linhas:
+            if linha.tipo == "snapshot":
+                estado = dict(linha.campos)
+                continue
+            estado.update(linha.campos)
+            if pendentes and linha.versao == pendentes[0]:
+                session.add(HistoricoFicha(
+                    personagem_id=char_id, versao=linha.versao, tipo="snapshot", campos=dict(estado),
+                ))
+                pendentes.pop(0)
+        await session.flush()
+
+    # 2. Retenção: a nova base é o snapshot mais recente que ainda deixa 'maximo' deltas depois dele
+    deltas = [m.versao for m in metas if m.tipo == "delta"]
+    podados = 0
+    if len(deltas) > maximo:
+        bases = sorted({m.versao for m in metas if m.tipo == "snapshot"} | set(novos), reverse=True)
+        for versao_base in bases:
+            if sum(1 for v in deltas if v > versao_base) >= maximo:
+                resultado = await session.execute(delete(H).where(
+                    H.personagem_id == char_id,
+                    (H.versao < versao_base) | ((H.versao == versao_base) & (H.tipo == "delta")),
+                ))
+                podados = resultado.rowcount
+                break
+    return {"snapshots": len(novos), "podados": podados}
+
+
+class Compactador:
+    """Agenda a compactação de uma ficha a cada SNAPSHOT_A_CADA deltas gravados neste processo."""
+
+    def __init__(self, a_cada: int = SNAPSHOT_A_CADA):
+        self.a_cada = a_cada
+        self._contagem = {}  # char_id -> deltas desde a última compactação
+        self._em_andamento = set()
+        self._tarefas = set()
+        self._lock = threading.Lock()
+        self._fabrica = None
+
+    def iniciar(self, fabrica_sessao):
+        self._fabrica = fabrica_sessao
+
+    async def parar(self):
+        if self._tarefas:
+            await asyncio.gather(*self._tarefas, return_exceptions=True)
+
+    def anotar(self, char_id: int):
+        """Chamado depois do commit de cada delta; fora do caminho da resposta."""
+        with self._lock:
+            contagem = self._contagem.get(char_id, 0) + 1
+            if contagem < self.a_cada or char_id in self._em_andamento or self._fabrica is None:
+                self._contagem[char_id] = contagem
+                return
+            self._contagem.pop(char_id, None)
+            self._em_andamento.add(char_id)
+        tarefa = asyncio.create_task(self._compactar(char_id))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _compactar(self, char_id: int):
+        try:
+            async with self._fabrica() as session:
+                resultado = await compactar(session, char_id)
+                await session.commit()
+            logger.debug("Histórico da ficha %s compactado: %s", char_id, resultado)
+        except Exception:
+            logger.exception("Erro ao compactar o histórico da ficha %s", char_id)
+        finally:
+            with self._lock:
+                self._em_andamento.discard(char_id)
+
+
+compactador = Compactador()
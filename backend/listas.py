@@ -0,0 +1,164 @@
+import copy
+import json
+import uuid
+
+from sqlalchemy import text
+
+from .models import Personagem
+
+# ==============================================================================
+# OPERAÇÕES POR ELEMENTO NAS COLUNAS JSON DE LISTA
+# ==============================================================================
+# Formato (inspirado no JSON-Patch, mas endereçando itens por índice ou id):
+#   {"op": "append",  "value": {...}}
+#   {"op": "replace", "index": 2 | "id": "abc", "value": {...}}
+#   {"op": "remove",  "index": 2 | "id": "abc"}
+#   {"op": "move",    "index": 2 | "id": "abc", "to": 0}
+
+CAMPOS_LISTA = ("ataques", "inventario", "magias", "habilidades", "leque_destino")
+OPERACOES = ("append", "replace", "remove", "move")
+MAX_OPERACOES = 100
+
+
+class OperacaoInvalida(ValueError):
+    pass
+
+
+def novo_id_item() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def validar_operacoes(ops) -> list:
+    if not isinstance(ops, list) or not ops:
+        raise OperacaoInvalida("'ops' deve ser uma lista não vazia.")
+    if len(ops) > MAX_OPERACOES:
+        raise OperacaoInvalida(f"Máximo de {MAX_OPERACOES} operações por requisição.")
+
+    validas = []
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get("op") not in OPERACOES:
+            raise OperacaoInvalida(f"Operação {n}: 'op' deve ser um de {', '.join(OPERACOES)}.")
+        nome = op["op"]
+
+        if nome != "append":
+            tem_indice = isinstance(op.get("index"), int) and not isinstance(op.get("index"), bool)
+            tem_id = isinstance(op.get("id"), (str, int)) and not isinstance(op.get("id"), bool)
+            if tem_indice == tem_id:
+                raise OperacaoInvalida(f"Operação {n}: informe 'index' (inteiro) ou 'id', não ambos.")
+        if nome in ("append", "replace") and not isinstance(op.get("value"), dict):
+            raise OperacaoInvalida(f"Operação {n}: 'value' deve ser um objeto.")
+        if nome == "move" and (not isinstance(op.get("to"), int) or isinstance(op.get("to"), bool)):
+            raise OperacaoInvalida(f"Operação {n}: 'to' deve ser um inteiro.")
+
+        nova = dict(op)
+        if nome == "append" and "id" not in nova["value"]:
+            # Itens novos ganham id para poderem ser endereçados depois
+            nova["value"] = {**nova["value"], "id": novo_id_item()}
+        validas.append(nova)
+    return validas
+
+
+def _localizar(lista: list, op: dict, n: int) -> int:
+    if "index" in op:
+        indice = op["index"]
+        if not 0 <= indice < len(lista):
+            raise OperacaoInvalida(f"Operação {n}: índice {indice} fora da lista ({len(lista)} itens).")
+        return indice
+    for indice, item in enumerate(lista):
+        if isinstance(item, dict) and item.get("id") is not None and str(item["id"]) == str(op["id"]):
+            return indice
+    raise OperacaoInvalida(f"Operação {n}: item com id {op['id']!r} não encontrado.")
+
+
+def aplicar_operacoes(lista, ops: list) -> list:
+    """Aplica as operações já validadas numa cópia da lista (tudo ou nada)."""
+    resultado = copy.deepcopy(lista or [])
+    for n, op in enumerate(ops):
+        nome = op["op"]
+        if nome == "append":
+            resultado.append(op["value"])
+        elif nome == "replace":
+            indice = _localizar(resultado, op, n)
+            anterior = resultado[indice]
+            novo = op["value"]
+            # O cliente costuma mandar o item sem o id: preservamos o que já existia
+            if "id" not in novo and isinstance(anterior, dict) and "id" in anterior:
+                novo = {"id": anterior["id"], **novo}
+            resultado[indice] = novo
+        elif nome == "remove":
+            del resultado[_localizar(resultado, op, n)]
+        elif nome == "move":
+            origem = _localizar(resultado, op, n)
+            item = resultado.pop(origem)
+            destino = op["to"]
+            if not 0 <= destino <= len(resultado):
+                raise OperacaoInvalida(f"Operação {n}: destino {destino} fora da lista.")
+            resultado.insert(destino, item)
+    return resultado
+
+
+# ==============================================================================
+# CAMINHO NATIVO DO POSTGRES (jsonb)
+# ==============================================================================
+# Uma única operação append/replace/remove vira um UPDATE que o próprio banco
+# aplica, sem trafegar a lista inteira. Lotes e "move" usam o caminho em Python.
+
+def suporta_sql_nativo(dialeto: str, ops: list) -> bool:
+    return dialeto == "postgresql" and len(ops) == 1 and ops[0]["op"] != "move"
+
+
+def montar_update_nativo(campo: str, op: dict):
+    """Devolve (sql, params). 'campo' precisa estar em CAMPOS_LISTA (vai direto no SQL).
+
+    O UPDATE devolve a nova versão e a lista resultante (RETURNING versao, campo);
+    nenhuma linha = não aplicado.
+    """
+    if campo not in CAMPOS_LISTA:
+        raise OperacaoInvalida(f"Campo '{campo}' não é uma lista.")
+
+    lista = f"COALESCE({campo}::jsonb, '[]'::jsonb)"
+    params = {}
+    if op["op"] == "append":
+        params["valor"] = json.dumps(op["value"], ensure_ascii=False)
+        sql = (
+            f"UPDATE personagem SET {campo} = ({lista} || jsonb_build_array(CAST(:valor AS jsonb)))::json, "
+            f"versao = versao + 1 "
+            f"WHERE id = :char_id AND usuario_id = :usuario_id "
+            f"RETURNING versao, {campo}"
+        )
+        return _com_tipos(sql, campo), params
+
+    if "index" in op:
+        indice = "CAST(:indice AS integer)"  # asyncpg exige o tipo explícito
+        params["indice"] = op["index"]
+    else:
+        indice = (
+            f"(SELECT e.pos - 1 FROM jsonb_array_elements({lista}) WITH ORDINALITY AS e(item, pos) "
+            f"WHERE e.item->>'id' = :item_id LIMIT 1)"
+        )
+        params["item_id"] = str(op["id"])
+
+    if op["op"] == "replace":
+        params["valor"] = json.dumps(op["value"], ensure_ascii=False)
+        # Mesmo comportamento do caminho em Python: mantém o id do item substituído
+        item_antigo = f"({lista} -> ({indice})::int)"
+        novo = (
+            f"jsonb_set({lista}, ARRAY[({indice})::text], "
+            f"jsonb_strip_nulls(jsonb_build_object('id', {item_antigo} -> 'id')) || CAST(:valor AS jsonb))"
+        )
+    else:
+        novo = f"({lista} - ({indice})::int)"
+
+    sql = (
+        f"UPDATE personagem SET {campo} = {novo}::json, versao = versao + 1 "
+        f"WHERE id = :char_id AND usuario_id = :usuario_id "
+        f"AND ({indice}) IS NOT NULL AND ({indice}) >= 0 AND ({indice}) < jsonb_array_length({lista}) "
+        f"RETURNING versao, {campo}"
+    )
+    return _com_tipos(sql, campo), params
+
+
+def _com_tipos(sql: str, campo: str):
+    # A lista devolvida volta como JSON decodificado (o asyncpg entregaria texto)
+    colunas = Personagem.__table__.c
+    return text(sql).columns(colunas.versao, colunas[campo])
@@ -1,18 +1,40 @@
+import time
+
+_INICIO = time.perf_counter()  # Antes dos imports: o relatório de partida mede também eles
+
+import asyncio
+import json
+import logging
+import os
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
-from fastapi import FastAPI, Depends, Request, Body
+from fastapi import FastAPI, Depends, Request, Body, File, UploadFile
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import Session, select, SQLModel
-from sqlalchemy import Column, JSON
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Column, JSON, text, update, or_
 from sqlalchemy.orm.attributes import flag_modified
 import hashlib
 
 # Importações internas
-from .database import engine, get_session
+from .database import engine, async_engine, get_async_session, AsyncSessionLocal, DATABASE_URL
 from .models import Personagem, Usuario
+from . import alteracoes, assets, avatars, busca, dados, historico, listas, metricas, partida, regras, resumos, sessoes, migracoes
+from .difusao import difusao
+from .eventos import barramento
+from .roster import roster, resumo_roster, consulta_roster, TOPICO_ROSTER
+from .cache_fichas import cache_fichas, etag_ficha, definir_impressao_assets
+from .escrita_adiada import escrita_adiada, dono_da_ficha
+
+# Nível do log: GIHARAD_LOG_LEVEL=DEBUG/INFO/WARNING (uvicorn configura só os loggers dele)
+logging.basicConfig(
+    level=os.environ.get("GIHARAD_LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
 
 # ==============================================================================
 # 1. LISTA MESTRA DE COMPETÊNCIAS (ATUALIZADA)
@@ -26,38 +48,38 @@ LISTA_COMPETENCIAS = [
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    SQLModel.metadata.create_all(engine)
+    # Um startup normal faz só a checagem de versão; as pendentes rodam uma única vez
     try:
-        from sqlalchemy import inspect, text
-        inspector = inspect(engine)
-        
-        # Só tenta pegar colunas se a tabela existir no banco
-        if inspect(engine).has_table("personagem"):
-            columns = [col['name'] for col in inspector.get_columns('personagem')]
-            
-            with Session(engine) as session:
-                if 'bonus_fisico' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN bonus_fisico INTEGER DEFAULT 0"))
-                if 'bonus_presenca' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN bonus_presenca INTEGER DEFAULT 0"))
-                if 'bonus_carisma' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN bonus_carisma INTEGER DEFAULT 0"))
-                if 'bonus_astucia' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN bonus_astucia INTEGER DEFAULT 0"))
-                if 'marca_hafa' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN marca_hafa VARCHAR DEFAULT ''"))
-                if 'leque_destino' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN leque_destino JSON DEFAULT '[]'"))
-                if 'avatar' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN avatar TEXT DEFAULT ''"))
-                if 'usuario_id' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN usuario_id INTEGER DEFAULT NULL"))
-                if 'is_active' not in columns:
-                    session.exec(text("ALTER TABLE personagem ADD COLUMN is_active BOOLEAN DEFAULT false"))
-                session.commit()
-    except Exception as e:
-        print(f"Erro na migração de colunas: {e}")
+        with partida.relatorio.fase("migracoes"):
+            aplicadas = migracoes.migrar(engine)
+        if aplicadas:
+            logger.info("%s migração(ões) aplicada(s).", aplicadas)
+    except Exception:
+        logger.exception("Erro ao aplicar migrações")
+        raise
+    # Abre a primeira conexão do pool agora, e não na primeira requisição
+    with partida.relatorio.fase("banco"):
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    # Só regera static/dist/ se algum arquivo de frontend/static mudou
+    with partida.relatorio.fase("assets"):
+        await run_in_threadpool(assets.carregar)
+    definir_impressao_assets(assets.impressao_manifesto())
+    if partida.AQUECER_TEMPLATES:
+        # Com o cache em disco, só carrega o bytecode; sem ele, compila aqui
+        with partida.relatorio.fase("templates"):
+            await run_in_threadpool(partida.aquecer_templates, templates.env)
+    logger.info(partida.relatorio.resumo())
+    # A difusão primeiro: com ela ligada, a escrita adiada fica desligada
+    await difusao.iniciar(DATABASE_URL)
+    escrita_adiada.iniciar(AsyncSessionLocal, engine.dialect.name, varios_workers=difusao.ativa)
+    historico.compactador.iniciar(AsyncSessionLocal)
     yield
+    # Grava os contadores pendentes antes de fechar as conexões
+    await escrita_adiada.parar()
+    await historico.compactador.parar()
+    await difusao.parar()
+    await async_engine.dispose()
 
 from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi.middleware.cors import CORSMiddleware
@@ -81,13 +103,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Por último = mais externo: mede a requisição inteira, inclusive os outros middlewares
+app.add_middleware(metricas.MiddlewareMetricas)
+metricas.instrumentar_engine(engine)
+metricas.instrumentar_engine(async_engine.sync_engine)
+
+@metricas.registro.coletor
+def _metricas_internas():
+    cache = cache_fichas.estatisticas()
+    return [
+        ("giharad_cache_fichas_entradas", "Fichas renderizadas em cache", "gauge", cache["entradas"]),
+        ("giharad_cache_fichas_bytes", "Bytes de HTML no cache de fichas", "gauge", cache["bytes"]),
+        ("giharad_roster_assinantes", "Conexões abertas no stream do roster", "gauge", barramento.total_assinantes(TOPICO_ROSTER)),
+        ("giharad_escrita_adiada_fichas", "Fichas com contadores ainda não gravados", "gauge", escrita_adiada.total_pendentes()),
+        *partida.relatorio.metricas(),
+    ]
+
+# Eventos de outros workers (roster e /changes se registram nos próprios módulos)
+@difusao.tratador("usuario")
+def _usuario_remoto(dados: dict):
+    sessoes.cache_usuarios.invalidar(dados["id"])
+
+@difusao.tratador("ficha_apagada")
+def _ficha_apagada_remota(dados: dict):
+    cache_fichas.invalidar(dados["id"])
+    escrita_adiada.descartar(dados["id"])
+
 # Configurações de Caminhos
 BASE_DIR = Path(__file__).resolve().parent.parent 
 TEMPLATES_DIR = BASE_DIR / "frontend" / "templates"
 STATIC_DIR = BASE_DIR / "frontend" / "static"
 
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+app.mount("/static", assets.StaticComprimido(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+partida.configurar_cache_templates(templates.env)
+templates.env.globals["avatar_url"] = avatars.url_avatar
+templates.env.globals["avatar_miniatura_url"] = avatars.url_miniatura
+templates.env.globals["asset_url"] = assets.url_asset
+templates.env.globals["fundos_slideshow"] = assets.fundos_slideshow
 
 # ==============================================================================
 # 2. UTILITÁRIOS
@@ -100,15 +153,25 @@ def safe_int(value, default=0):
     except (ValueError, TypeError):
         return default
 
-def get_current_user(request: Request, session: Session) -> Optional[Usuario]:
-    user_id_str = request.cookies.get("giharad_user_id")
-    if not user_id_str:
+async def get_current_user(request: Request, session: AsyncSession) -> Optional[sessoes.UsuarioSessao]:
+    dados = sessoes.ler_token(request.cookies.get(sessoes.NOME_COOKIE))
+    if not dados:
         return None
+
+    # Caminho quente (autosave, visualizar ficha): resolvido sem tocar no banco
+    user = sessoes.cache_usuarios.obter(dados["uid"])
+    if user:
+        return user
+
     try:
-        user_id = int(user_id_str)
-        return session.get(Usuario, user_id)
+        usuario = await session.get(Usuario, dados["uid"])
     except Exception:
         return None
+    if not usuario:
+        return None
+    user = sessoes.UsuarioSessao(id=usuario.id, username=usuario.username)
+    sessoes.cache_usuarios.guardar(user)
+    return user
 
 # ==============================================================================
 # 3. ROTAS DE VISUALIZAÇÃO E AUTH
@@ -120,16 +183,17 @@ def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "error": None})
 
 @app.post("/login", response_class=HTMLResponse)
-def login_action(request: Request, response: Response, username: str = Form(...), password: str = Form(...), session: Session = Depends(get_session)):
+async def login_action(request: Request, response: Response, username: str = Form(...), password: str = Form(...), session: AsyncSession = Depends(get_async_session)):
     stmt = select(Usuario).where(Usuario.username == username)
-    user = session.exec(stmt).first()
+    user = (await session.exec(stmt)).first()
     
     password_hash = hashlib.sha256(password.encode()).hexdigest()
     if not user or user.password_hash != password_hash:
         return templates.TemplateResponse("login.html", {"request": request, "error": "Usuário ou senha inválidos."})
     
     resp = RedirectResponse(url="/", status_code=303)
-    resp.set_cookie(key="giharad_user_id", value=str(user.id), httponly=True)
+    sessoes.definir_cookie_sessao(resp, request, user.id, user.username)
+    sessoes.cache_usuarios.guardar(sessoes.UsuarioSessao(id=user.id, username=user.username))
     return resp
 
 @app.get("/register", response_class=HTMLResponse)
@@ -137,70 +201,102 @@ def register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request, "error": None})
 
 @app.post("/register", response_class=HTMLResponse)
-def register_action(request: Request, response: Response, username: str = Form(...), password: str = Form(...), confirm_password: str = Form(...), session: Session = Depends(get_session)):
+async def register_action(request: Request, response: Response, username: str = Form(...), password: str = Form(...), confirm_password: str = Form(...), session: AsyncSession = Depends(get_async_session)):
     if password != confirm_password:
         return templates.TemplateResponse("register.html", {"request": request, "error": "As senhas não coincidem."})
     
     stmt = select(Usuario).where(Usuario.username == username)
-    existing_user = session.exec(stmt).first()
+    existing_user = (await session.exec(stmt)).first()
     if existing_user:
         return templates.TemplateResponse("register.html", {"request": request, "error": "Nome de usuário já existe."})
         
     password_hash = hashlib.sha256(password.encode()).hexdigest()
     new_user = Usuario(username=username, password_hash=password_hash)
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await session.commit()
+    await session.refresh(new_user)
     
     resp = RedirectResponse(url="/", status_code=303)
-    resp.set_cookie(key="giharad_user_id", value=str(new_user.id), httponly=True)
+    sessoes.definir_cookie_sessao(resp, request, new_user.id, new_user.username)
+    sessoes.cache_usuarios.guardar(sessoes.UsuarioSessao(id=new_user.id, username=new_user.username))
     return resp
 
 @app.get("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    dados = sessoes.ler_token(request.cookies.get(sessoes.NOME_COOKIE))
+    if dados:
+        sessoes.cache_usuarios.invalidar(dados["uid"])
+        difusao.enviar("usuario", {"id": dados["uid"]})
     resp = RedirectResponse(url="/login", status_code=303)
-    resp.delete_cookie("giharad_user_id")
+    resp.delete_cookie(sessoes.NOME_COOKIE)
+    resp.delete_cookie(sessoes.COOKIE_LEGADO)
     return resp
 
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request, session: Session = Depends(get_session)):
-    user = get_current_user(request, session)
+async def home(request: Request, session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
         
-    statement = select(Personagem).where(Personagem.usuario_id == user.id)
-    resultados = session.exec(statement).all()
+    # Só as colunas da carta, uma página por vez
+    pagina = max(safe_int(request.query_params.get("pagina"), 1), 1)
+    linhas = (await session.exec(resumos.consulta_cartas(user.id, pagina))).all()
+    paginacao = resumos.paginar(linhas, pagina)
     return templates.TemplateResponse(
         name="index.html", 
-        context={"request": request, "personagens": resultados, "usuario": user}
+        context={"request": request, "personagens": paginacao["itens"], "paginacao": paginacao, "usuario": user}
     )
 
+def _resposta_ficha(corpo: bytes, etag: str):
+    # no-cache: o navegador guarda, mas sempre revalida pelo ETag (a ficha muda a todo momento)
+    return HTMLResponse(content=corpo, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
 @app.get("/ficha/{char_id}", response_class=HTMLResponse)
-def visualizar_ficha(request: Request, char_id: int, session: Session = Depends(get_session)):
-    personagem = session.get(Personagem, char_id)
-    user = get_current_user(request, session)
-    
+async def visualizar_ficha(request: Request, char_id: int, session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
-        
-    if not personagem: 
+
+    # Contadores ainda em memória entram no banco antes (e sobem a versão)
+    await escrita_adiada.descarregar(char_id)
+
+    # Consulta leve: só versão e dono decidem se dá para responder sem renderizar
+    stmt = select(Personagem.versao, Personagem.usuario_id).where(Personagem.id == char_id)
+    linha = (await session.exec(stmt)).first()
+    if not linha:
+        return RedirectResponse(url="/", status_code=303)
+
+    versao, dono_id = linha
+    is_owner = (str(dono_id) == str(user.id))
+    etag = etag_ficha(char_id, versao, is_owner)
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+    corpo = cache_fichas.obter(char_id, versao, is_owner)
+    if corpo is not None:
+        return _resposta_ficha(corpo, etag)
+
+    personagem = await session.get(Personagem, char_id)
+    if not personagem:
         return RedirectResponse(url="/", status_code=303)
-        
-    is_owner = (str(personagem.usuario_id) == str(user.id))
-    
-    return templates.TemplateResponse(
-        name="ficha.html", 
-        context={
-            "request": request, 
-            "ficha": personagem, 
-            "lista_skills": LISTA_COMPETENCIAS,
-            "is_owner": is_owner
-        }
-    )
+
+    # A linha pode ter mudado entre as duas consultas: a chave usa a versão renderizada
+    etag = etag_ficha(char_id, personagem.versao, is_owner)
+    contexto = {
+        "request": request,
+        "ficha": personagem,
+        "lista_skills": LISTA_COMPETENCIAS,
+        "is_owner": is_owner
+    }
+    html = await run_in_threadpool(templates.get_template("ficha.html").render, contexto)
+    corpo = html.encode("utf-8")
+    cache_fichas.guardar(char_id, personagem.versao, is_owner, corpo)
+    return _resposta_ficha(corpo, etag)
 
 @app.get("/novo")
-def criar_personagem_direto(request: Request, session: Session = Depends(get_session)):
-    user = get_current_user(request, session)
+async def criar_personagem_direto(request: Request, session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
         
@@ -232,12 +328,14 @@ def criar_personagem_direto(request: Request, session: Session = Depends(get_ses
     
     try:
         session.add(novo_char)
-        session.commit()
-        session.refresh(novo_char)
+        await session.flush()
+        historico.base(session, novo_char)
+        await session.commit()
+        await session.refresh(novo_char)
         return RedirectResponse(url=f"/ficha/{novo_char.id}", status_code=303)
     except Exception as e:
-        session.rollback()
-        print(f"ERRO NO BANCO: {e}")
+        await session.rollback()
+        logger.exception("Erro ao criar personagem")
         return {"error": str(e)}
 
 # ==============================================================================
@@ -245,124 +343,218 @@ def criar_personagem_direto(request: Request, session: Session = Depends(get_ses
 # ==============================================================================
 
 @app.post("/deletar/{char_id}")
-def deletar_personagem(request: Request, char_id: int, session: Session = Depends(get_session)):
-    user = get_current_user(request, session)
+async def deletar_personagem(request: Request, char_id: int, session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
         
-    personagem = session.get(Personagem, char_id)
+    personagem = await session.get(Personagem, char_id)
     if personagem and personagem.usuario_id == user.id:
-        session.delete(personagem)
-        session.commit()
+        estava_ativa = personagem.is_active
+        await alteracoes.apagar(session, char_id)
+        await busca.apagar(session, engine.dialect.name, char_id)
+        await historico.apagar(session, char_id)
+        await session.delete(personagem)
+        await session.commit()
+        cache_fichas.invalidar(char_id)
+        escrita_adiada.descartar(char_id)
+        difusao.enviar("ficha_apagada", {"id": char_id})
+        if estava_ativa:
+            roster.sair(char_id)
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/api/personagem/{char_id}/active")
-def definir_ficha_ativa(request: Request, char_id: int, session: Session = Depends(get_session)):
-    user = get_current_user(request, session)
+async def definir_ficha_ativa(request: Request, char_id: int, session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
     if not user:
         return {"status": "error", "message": "Não autenticado"}
         
-    personagem = session.get(Personagem, char_id)
-    if not personagem or personagem.usuario_id != user.id:
-        return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
-        
     try:
-        # Desativa todos os outros personagens deste usuário
-        stmt = select(Personagem).where(Personagem.usuario_id == user.id)
-        meus_personagens = session.exec(stmt).all()
-        
-        for p in meus_personagens:
-            p.is_active = (p.id == char_id)
-            session.add(p)
-            
-        session.commit()
+        # O resumo do roster sai do banco: grava antes os contadores pendentes
+        await escrita_adiada.descarregar(char_id)
+        # Um único UPDATE: ativa esta e desativa as outras do usuário. O WHERE só
+        # alcança as linhas que mudam (a ativa atual está no índice parcial).
+        stmt = (
+            update(Personagem)
+            .where(Personagem.usuario_id == user.id)
+            .where(or_(Personagem.is_active == True, Personagem.id == char_id))
+            .values(is_active=(Personagem.id == char_id))
+            .returning(Personagem.id, Personagem.versao)
+        )
+        alterados = {linha.id: linha.versao for linha in await session.execute(stmt)}
+        if char_id not in alterados:
+            await session.rollback()
+            return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+
+        for alterado_id, versao in alterados.items():
+            await alteracoes.registrar(session, engine.dialect.name, alterado_id, ["is_active"], versao)
+        linha = (await session.exec(consulta_roster(char_id))).first()
+        await session.commit()
+
+        for alterado_id, versao in alterados.items():
+            alteracoes.publicar(alterado_id, versao)
+            if alterado_id != char_id:
+                roster.sair(alterado_id)
+        roster.entrar(resumo_roster(linha, linha.username))
         return {"status": "success"}
     except Exception as e:
-        session.rollback()
-        print(f"ERRO AO DEFINIR ACTIVE: {e}")
+        await session.rollback()
+        logger.exception("Erro ao definir ficha ativa")
         return {"status": "error", "message": f"Erro interno: {str(e)}"}
 
 @app.post("/api/personagem/{char_id}/deactivate")
-def remover_ficha_ativa(request: Request, char_id: int, session: Session = Depends(get_session)):
-    user = get_current_user(request, session)
+async def remover_ficha_ativa(request: Request, char_id: int, session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
     if not user:
         return {"status": "error", "message": "Não autenticado"}
         
-    personagem = session.get(Personagem, char_id)
-    if not personagem or personagem.usuario_id != user.id:
-        return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
-        
     try:
-        personagem.is_active = False
-        session.add(personagem)
-        session.commit()
+        await escrita_adiada.descarregar(char_id)
+        stmt = (
+            update(Personagem)
+            .where(Personagem.id == char_id, Personagem.usuario_id == user.id)
+            .values(is_active=False)
+            .returning(Personagem.versao)
+        )
+        versao = (await session.execute(stmt)).scalar()
+        if versao is None:
+            await session.rollback()
+            return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+        await alteracoes.registrar(session, engine.dialect.name, char_id, ["is_active"], versao)
+        await session.commit()
+        alteracoes.publicar(char_id, versao)
+        roster.sair(char_id)
         return {"status": "success"}
     except Exception as e:
-        session.rollback()
-        print(f"ERRO AO REMOVER ACTIVE: {e}")
+        await session.rollback()
+        logger.exception("Erro ao remover ficha ativa")
         return {"status": "error", "message": f"Erro interno: {str(e)}"}
 
+async def _carregar_roster(session: AsyncSession):
+    # Servido da memória; o banco só é consultado na primeira vez ou após o TTL
+    resultado = roster.snapshot()
+    if resultado is not None:
+        return resultado
+
+    marca = roster.marca()
+    linhas = (await session.exec(consulta_roster())).all()
+    resultado = [resumo_roster(linha, linha.username) for linha in linhas]
+    roster.semear(resultado, marca)
+    return resultado
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    # Formato texto do Prometheus; 404 para quem não é local (ver metricas.acesso_local)
+    if not metricas.acesso_local(request):
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Não encontrado"})
+    return PlainTextResponse(metricas.registro.expor(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/active_characters")
-def listar_fichas_ativas(request: Request, session: Session = Depends(get_session)):
-    # Retorna todos os personagens de todos os usuários que estão ativos e faz join pra pegar o username
-    stmt = select(Personagem, Usuario).outerjoin(Usuario, Personagem.usuario_id == Usuario.id).where(Personagem.is_active == True)
-    ativos = session.exec(stmt).all()
-    
-    resultado = []
-    for p, u in ativos:
-        resultado.append({
-            "id": p.id,
-            "nome": p.nome,
-            "jogador": u.username if u else (p.jogador or "Sem Conta"),
-            "raca": p.raca,
-            "classe": p.classe,
-            "nivel": p.nivel,
-            "avatar": p.avatar,
-            "pv_atual": p.pv_atual,
-            "pv_max": p.pv_max,
-            "pa_atual": p.pa_atual,
-            "pa_max": p.pa_max,
-            "ph_atual": p.ph_atual,
-            "ph_max": p.ph_max,
-            "pg_atual": p.pg_atual,
-            "pg_max": p.pg_max,
-        })
-        
-    return {"status": "success", "data": resultado}
+async def listar_fichas_ativas(request: Request, session: AsyncSession = Depends(get_async_session)):
+    return {"status": "success", "data": await _carregar_roster(session)}
+
+def _evento_sse(tipo: str, dados) -> str:
+    return f"event: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+@app.get("/api/active_characters/stream")
+async def stream_fichas_ativas(request: Request):
+    # Server-Sent Events: um snapshot ao conectar e depois só as diferenças
+    async def snapshot():
+        async with AsyncSessionLocal() as session:
+            return await _carregar_roster(session)
+
+    async def gerador():
+        async with barramento.assinar(TOPICO_ROSTER) as fila:
+            # Assina antes do snapshot para não perder nada entre os dois
+            yield _evento_sse("snapshot", await snapshot())
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"  # Mantém o túnel (ngrok) aberto
+                    continue
+                if evento["tipo"] == "resync":
+                    yield _evento_sse("snapshot", await snapshot())
+                else:
+                    yield _evento_sse(evento["tipo"], evento)
+
+    return StreamingResponse(
+        gerador(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Campos numéricos que chegam como texto dos inputs
+CAMPOS_INTEIROS = frozenset([
+    'nivel', 'pv_max', 'pv_atual', 'pv_bonus', 'pa_max', 'pa_atual', 'pa_bonus', 'defesa',
+    'pg_max', 'pg_atual', 'pg_bonus', 'ph_max', 'ph_atual', 'ph_bonus', 'descansos_curtos',
+    'fisico', 'presenca', 'carisma', 'astucia',
+    'bonus_fisico', 'bonus_presenca', 'bonus_carisma', 'bonus_astucia',
+    'fisico_exp', 'fisico_inc', 'presenca_exp', 'presenca_inc',
+    'carisma_exp', 'carisma_inc', 'astucia_exp', 'astucia_inc',
+    'slots_nv1', 'slots_nv2', 'slots_nv3', 'slots_nv4', 'slots_nv5', 'slots_nv6',
+    'slots_nv1_max', 'slots_nv2_max', 'slots_nv3_max', 'slots_nv4_max', 'slots_nv5_max', 'slots_nv6_max'
+])
 
 @app.post("/api/atualizar_campo/{char_id}")
 async def api_atualizar_campo(
     request: Request,
     char_id: int, 
     data: dict = Body(...), 
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    user = get_current_user(request, session)
+    user = await get_current_user(request, session)
     if not user:
         return {"status": "error", "message": "Não autenticado"}
-        
-    personagem = session.get(Personagem, char_id)
+
+    # Versão da ficha que o cliente tinha quando editou (concorrência otimista)
+    versao_cliente = data.pop("_versao", None)
+    aba = alteracoes.ler_aba(data.pop("_aba", None))
+
+    if escrita_adiada.aceita(data):
+        # Só contadores (PV, PA, espaços...): vale o último clique, sem checar
+        # conflito; a resposta sai já e a gravação vai no próximo lote
+        if await dono_da_ficha(session, char_id) != user.id:
+            return {"status": "error"}
+        escrita_adiada.registrar(char_id, {campo: safe_int(valor) for campo, valor in data.items()}, aba)
+        return {"status": "success", "adiado": True}
+    # Escrita imediata: os contadores pendentes desta ficha vão antes, na ordem
+    await escrita_adiada.descarregar(char_id)
+
+    # Trava a linha até o commit: checagem de conflito e escrita ficam atômicas
+    stmt = select(Personagem).where(Personagem.id == char_id).with_for_update()
+    personagem = (await session.exec(stmt)).first()
     if not personagem or personagem.usuario_id != user.id: 
         return {"status": "error"}
     
     try:
+        # id, usuario_id e versao nunca são gravados a partir do cliente
+        data = {campo: valor for campo, valor in data.items() if alteracoes.campo_sincronizado(campo)}
+
+        if versao_cliente is not None:
+            em_conflito = await alteracoes.conflitos(session, char_id, data, safe_int(versao_cliente), aba)
+            if em_conflito:
+                atuais = alteracoes.serializar(personagem, em_conflito)
+                await session.rollback()
+                return JSONResponse(status_code=409, content={
+                    "status": "error",
+                    "message": "A ficha foi alterada em outro lugar",
+                    "conflito": True,
+                    "campos": atuais,
+                })
+
+        versao_anterior = personagem.versao
         for campo, valor in data.items():
             # Converte números se necessário
-            int_fields = [
-                'nivel', 'pv_max', 'pv_atual', 'pv_bonus', 'pa_max', 'pa_atual', 'pa_bonus', 'defesa', 
-                'pg_max', 'pg_atual', 'pg_bonus', 'ph_max', 'ph_atual', 'ph_bonus', 'descansos_curtos',
-                'fisico', 'presenca', 'carisma', 'astucia', 
-                'bonus_fisico', 'bonus_presenca', 'bonus_carisma', 'bonus_astucia',
-                'fisico_exp', 'fisico_inc', 'presenca_exp', 'presenca_inc',
-                'carisma_exp', 'carisma_inc', 'astucia_exp', 'astucia_inc',
-                'slots_nv1', 'slots_nv2', 'slots_nv3', 'slots_nv4', 'slots_nv5', 'slots_nv6',
-                'slots_nv1_max', 'slots_nv2_max', 'slots_nv3_max', 'slots_nv4_max', 'slots_nv5_max', 'slots_nv6_max'
-            ]
-            if campo in int_fields:
+            if campo in CAMPOS_INTEIROS:
                 valor = safe_int(valor)
                 if campo == 'nivel':
                     valor = min(max(valor, 1), 20)
             
+            # Clientes antigos ainda mandam o avatar como data URL: vai para o disco
+            if campo == 'avatar' and isinstance(valor, str) and valor.startswith('data:'):
+                valor = await run_in_threadpool(avatars.salvar_avatar_data_url, valor)
+
             if hasattr(personagem, campo):
                 setattr(personagem, campo, valor)
                 
@@ -371,10 +563,437 @@ async def api_atualizar_campo(
                     flag_modified(personagem, campo)
         
         session.add(personagem)
-        session.commit()
-        return {"status": "success"}
+        await session.flush()  # O UPDATE já devolve a nova versão (eager_defaults)
+        mudou = personagem.versao != versao_anterior  # Valores iguais não geram UPDATE
+        no_historico = False
+        if mudou:
+            novos = {campo: getattr(personagem, campo) for campo in data}
+            await alteracoes.registrar(session, engine.dialect.name, char_id, data, personagem.versao, aba)
+            await busca.atualizar(session, engine.dialect.name, char_id, novos)
+            no_historico = await historico.registrar(session, char_id, personagem.versao, novos)
+        await session.commit()
+        if mudou:
+            alteracoes.publicar(char_id, personagem.versao)
+        if no_historico:
+            historico.compactador.anotar(char_id)
+        roster.alterar(char_id, {campo: getattr(personagem, campo) for campo in data})
+        return {"status": "success", "versao": personagem.versao}
     
     except Exception as e:
-        session.rollback()
-        print(f"ERRO NO AUTO-SAVE: {e}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        await session.rollback()
+        logger.exception("Erro no auto-save")
+        return {"status": "error", "message": str(e)}
+
+TENTATIVAS_REGRA = 3
+
+@app.post("/api/personagem/{char_id}/regras/{nome}")
+async def api_regra(
+    request: Request,
+    char_id: int,
+    nome: str,
+    data: dict = Body(default={}),
+    session: AsyncSession = Depends(get_async_session)
+):
+    # Evoluir, recalcular e descansos: o servidor faz as contas (regras.py) e
+    # grava todos os campos derivados num único UPDATE
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+    operacao = regras.operacao(nome)
+    if operacao is None:
+        return {"status": "error", "message": f"Operação desconhecida: {nome}"}
+    funcao, colunas = operacao
+    aba = alteracoes.ler_aba(data.get("_aba"))
+
+    try:
+        await escrita_adiada.descarregar(char_id)  # As contas partem dos cliques mais recentes
+        for _ in range(TENTATIVAS_REGRA):
+            stmt = select(Personagem.usuario_id, Personagem.versao, *[getattr(Personagem, c) for c in colunas])
+            linha = (await session.exec(stmt.where(Personagem.id == char_id))).first()
+            if not linha or linha.usuario_id != user.id:
+                return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+            try:
+                novos = funcao(regras.normalizar(linha, colunas), data)
+            except regras.RegraInvalida as e:
+                await session.rollback()
+                return {"status": "error", "message": str(e)}
+
+            # Só grava se ninguém escreveu desde a leitura; senão refaz a conta com os valores novos
+            stmt = (
+                update(Personagem)
+                .where(Personagem.id == char_id, Personagem.versao == linha.versao)
+                .values(**novos)
+                .returning(Personagem.versao)
+            )
+            versao = (await session.execute(stmt)).scalar()
+            if versao is not None:
+                break
+            await session.rollback()
+        else:
+            return JSONResponse(status_code=409, content={
+                "status": "error", "message": "A ficha está sendo alterada em outro lugar, tente de novo",
+            })
+
+        await alteracoes.registrar(session, engine.dialect.name, char_id, novos, versao, aba)
+        no_historico = await historico.registrar(session, char_id, versao, novos)
+        await session.commit()
+        alteracoes.publicar(char_id, versao)
+        if no_historico:
+            historico.compactador.anotar(char_id)
+        roster.alterar(char_id, novos)
+        return {"status": "success", "versao": versao, "campos": novos}
+    except Exception as e:
+        await session.rollback()
+        logger.exception("Erro na operação de regras")
+        return {"status": "error", "message": str(e)}
+
+@app.post("/api/personagem/{char_id}/lista/{campo}")
+async def api_patch_lista(
+    request: Request,
+    char_id: int,
+    campo: str,
+    data: dict = Body(...),
+    session: AsyncSession = Depends(get_async_session)
+):
+    # Operações por elemento nas listas JSON (ataques, inventario, magias...)
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+    if campo not in listas.CAMPOS_LISTA:
+        return {"status": "error", "message": f"Campo '{campo}' não aceita operações de lista"}
+
+    try:
+        ops = listas.validar_operacoes(data.get("ops"))
+    except listas.OperacaoInvalida as e:
+        return {"status": "error", "message": str(e)}
+
+    versao_cliente = data.get("_versao")
+    aba = alteracoes.ler_aba(data.get("_aba"))
+    try:
+        if versao_cliente is not None:
+            # Concorrência otimista: trava a linha antes de checar, para a
+            # checagem e a escrita valerem como uma coisa só
+            trava = select(Personagem.id).where(Personagem.id == char_id, Personagem.usuario_id == user.id).with_for_update()
+            if (await session.exec(trava)).first() is None:
+                return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+            if await alteracoes.conflitos(session, char_id, [campo], safe_int(versao_cliente), aba):
+                atuais = await alteracoes.valores(session, char_id, [campo])
+                await session.rollback()
+                return JSONResponse(status_code=409, content={
+                    "status": "error",
+                    "message": "A lista foi alterada em outro lugar",
+                    "conflito": True,
+                    "campos": atuais,
+                })
+
+        if listas.suporta_sql_nativo(engine.dialect.name, ops):
+            sql, params = listas.montar_update_nativo(campo, ops[0])
+            resultado = await session.execute(sql, {**params, "char_id": char_id, "usuario_id": user.id})
+            linha = resultado.first()
+            if linha is None:
+                await session.rollback()
+                return {"status": "error", "message": "Personagem ou item não encontrado"}
+            versao, nova_lista = linha
+            mudou = True
+        else:
+            # Trava a linha para que duas abas não apliquem lotes intercalados
+            stmt = select(Personagem).where(Personagem.id == char_id).with_for_update()
+            personagem = (await session.exec(stmt)).first()
+            if not personagem or personagem.usuario_id != user.id:
+                return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+
+            versao_anterior = personagem.versao
+            nova_lista = listas.aplicar_operacoes(getattr(personagem, campo), ops)
+            setattr(personagem, campo, nova_lista)
+            flag_modified(personagem, campo)
+            session.add(personagem)
+            await session.flush()
+            versao = personagem.versao
+            mudou = versao != versao_anterior
+
+        no_historico = False
+        if mudou:
+            await alteracoes.registrar(session, engine.dialect.name, char_id, [campo], versao, aba)
+            await busca.atualizar(session, engine.dialect.name, char_id, {campo: nova_lista})
+            no_historico = await historico.registrar(session, char_id, versao, {campo: nova_lista})
+        await session.commit()
+        if mudou:
+            alteracoes.publicar(char_id, versao)
+        if no_historico:
+            historico.compactador.anotar(char_id)
+
+        novos_ids = [op["value"]["id"] for op in ops if op["op"] == "append"]
+        return {"status": "success", "ids": novos_ids, "versao": versao}
+
+    except listas.OperacaoInvalida as e:
+        await session.rollback()
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        await session.rollback()
+        logger.exception("Erro no patch de lista")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/personagem/{char_id}/changes")
+async def api_alteracoes(request: Request, char_id: int, session: AsyncSession = Depends(get_async_session)):
+    # Campos alterados depois da versão 'since'. Com ?espera=N (segundos), segura
+    # a resposta até algo mudar ou o tempo acabar (long-poll).
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+
+    desde = max(safe_int(request.query_params.get("since")), 0)
+    espera = min(max(safe_int(request.query_params.get("espera")), 0), alteracoes.ESPERA_MAXIMA)
+
+    def resposta(resultado):
+        # Contador que mudou de novo e ainda está na escrita adiada: manda o valor mais recente
+        pendentes = escrita_adiada.pendentes(char_id)
+        resultado["campos"].update({c: v for c, v in pendentes.items() if c in resultado["campos"]})
+        return {"status": "success", **resultado}
+
+    # Assina antes de consultar para não perder uma escrita que caia no meio
+    async with barramento.assinar(alteracoes.topico_ficha(char_id)) as fila:
+        resultado = await alteracoes.alteracoes_desde(session, char_id, desde)
+        if resultado is None:
+            return {"status": "error", "message": "Personagem não encontrado"}
+
+        if not resultado["campos"] and espera:
+            # Devolve a conexão ao pool enquanto espera: quem só observa a ficha
+            # não pode segurar uma conexão por 25s
+            await session.close()
+            try:
+                await asyncio.wait_for(fila.get(), timeout=espera)
+            except asyncio.TimeoutError:
+                return resposta(resultado)
+            resultado = await alteracoes.alteracoes_desde(session, char_id, desde) or resultado
+
+    return resposta(resultado)
+
+@app.get("/api/personagem/{char_id}/historico")
+async def api_historico(request: Request, char_id: int, session: AsyncSession = Depends(get_async_session)):
+    # Entradas mais recentes primeiro; ?antes=<versao> pagina para trás
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+    if await dono_da_ficha(session, char_id) != user.id:
+        return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+
+    antes = request.query_params.get("antes")
+    limite = min(max(safe_int(request.query_params.get("limite"), historico.POR_PAGINA), 1), 200)
+    entradas = await historico.listar(session, char_id, safe_int(antes) if antes else None, limite)
+    desfazer, refazer = await historico.pilhas(session, char_id)
+    return {"status": "success", "entradas": entradas, "pode_desfazer": bool(desfazer), "pode_refazer": bool(refazer)}
+
+@app.get("/api/personagem/{char_id}/historico/{versao}")
+async def api_historico_versao(request: Request, char_id: int, versao: int, session: AsyncSession = Depends(get_async_session)):
+    # A ficha como estava numa versão (campos do histórico: sem contadores nem avatar)
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+    if await dono_da_ficha(session, char_id) != user.id:
+        return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+
+    estado = await historico.estado_em(session, char_id, versao)
+    if estado is None:
+        return {"status": "error", "message": "Versão fora do histórico guardado"}
+    return {"status": "success", "versao": versao, "campos": estado}
+
+@app.post("/api/personagem/{char_id}/historico/{acao}")
+async def api_desfazer(request: Request, char_id: int, acao: str, session: AsyncSession = Depends(get_async_session)):
+    # Desfazer grava os valores de antes da última edição; refazer regrava os dela.
+    # Os dois entram no histórico como edições, então nada é perdido.
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+    if acao not in historico.ACOES:
+        return {"status": "error", "message": f"Ação desconhecida: {acao}"}
+
+    try:
+        trava = select(Personagem.usuario_id).where(Personagem.id == char_id).with_for_update()
+        if (await session.exec(trava)).first() != user.id:
+            return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+        try:
+            alvo, valores = await historico.planejar(session, char_id, acao)
+        except historico.HistoricoIndisponivel as e:
+            await session.rollback()
+            return {"status": "error", "message": str(e)}
+
+        stmt = update(Personagem).where(Personagem.id == char_id).values(**valores).returning(Personagem.versao)
+        versao = (await session.execute(stmt)).scalar()
+        await alteracoes.registrar(session, engine.dialect.name, char_id, valores, versao)
+        await busca.atualizar(session, engine.dialect.name, char_id, valores)
+        await historico.registrar(session, char_id, versao, valores, origem=acao, alvo=alvo)
+        await session.commit()
+        alteracoes.publicar(char_id, versao)
+        historico.compactador.anotar(char_id)
+        roster.alterar(char_id, valores)
+        return {"status": "success", "versao": versao, "campos": valores}
+    except Exception as e:
+        await session.rollback()
+        logger.exception("Erro ao %s", acao)
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/search")
+async def api_busca(request: Request, session: AsyncSession = Depends(get_async_session)):
+    # ?q=cura&em=magias,inventario&escopo=minhas|roster&pagina=N, por relevância
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+    try:
+        termos, secoes, escopo, pagina = busca.ler_pedido(request.query_params)
+    except busca.BuscaInvalida as e:
+        return {"status": "error", "message": str(e)}
+
+    sql, params = busca.consulta_busca(engine.dialect.name, termos, secoes, escopo, user.id, pagina)
+    relevancias = {linha.id: linha.relevancia for linha in await session.execute(sql, params)}
+    paginacao = resumos.paginar(list(relevancias), pagina, busca.RESULTADOS_POR_PAGINA)
+
+    # Só as fichas da página: colunas da carta e as seções para montar os trechos
+    colunas = [Personagem.id, Personagem.nome, Personagem.jogador, Personagem.classe, Personagem.nivel, Personagem.avatar]
+    stmt = (
+        select(*colunas, *[getattr(Personagem, c) for c in secoes], Usuario.username)
+        .outerjoin(Usuario, Personagem.usuario_id == Usuario.id)
+        .where(Personagem.id.in_(paginacao["itens"]))
+    )
+    fichas = {linha.id: linha for linha in (await session.exec(stmt)).all()}
+    resultados = [
+        busca.resultado(fichas[cid], relevancias[cid], fichas[cid].username, termos, secoes)
+        for cid in paginacao["itens"] if cid in fichas
+    ]
+    return {
+        "status": "success",
+        "resultados": resultados,
+        "pagina": paginacao["pagina"],
+        "proxima": paginacao["proxima"],
+    }
+
+# ==============================================================================
+# 5. AVATARES
+# ==============================================================================
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+@app.post("/api/personagem/{char_id}/avatar")
+async def enviar_avatar(request: Request, char_id: int, arquivo: UploadFile = File(...), session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+
+    personagem = await session.get(Personagem, char_id)
+    if not personagem or personagem.usuario_id != user.id:
+        return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+
+    conteudo = await arquivo.read(avatars.TAMANHO_MAXIMO + 1)
+    try:
+        # Hash, escrita em disco e miniatura (Pillow) ficam fora do event loop
+        ref = await run_in_threadpool(avatars.salvar_avatar, conteudo)
+    except avatars.AvatarInvalido as e:
+        return {"status": "error", "message": str(e)}
+
+    try:
+        versao_anterior = personagem.versao
+        personagem.avatar = ref
+        session.add(personagem)
+        await session.flush()
+        mudou = personagem.versao != versao_anterior  # Mesma imagem = mesma referência
+        if mudou:
+            await alteracoes.registrar(session, engine.dialect.name, char_id, ["avatar"], personagem.versao)
+        await session.commit()
+        if mudou:
+            alteracoes.publicar(char_id, personagem.versao)
+        roster.alterar(char_id, {"avatar": ref})
+        return {
+            "status": "success",
+            "avatar": avatars.url_avatar(ref),
+            "miniatura": avatars.url_miniatura(ref),
+            "versao": personagem.versao,
+        }
+    except Exception as e:
+        await session.rollback()
+        logger.exception("Erro ao salvar avatar")
+        return {"status": "error", "message": str(e)}
+
+def _servir_avatar(request: Request, ref: str, miniatura: bool):
+    if not avatars.referencia_valida(ref):
+        return Response(status_code=404)
+
+    caminho = avatars.caminho_avatar(ref)
+    media_type = avatars.TIPOS_MIDIA[ref.rsplit(".", 1)[1]]
+    etag = f'"{ref.split(".")[0]}"'
+    if miniatura:
+        mini = avatars.caminho_miniatura(ref)
+        # Sem Pillow não há miniatura: o original serve de fallback
+        if mini.exists():
+            caminho, media_type, etag = mini, "image/webp", f'"{ref.split(".")[0]}-mini"'
+
+    headers = {"ETag": etag, "Cache-Control": CACHE_IMUTAVEL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if not caminho.exists():
+        return Response(status_code=404)
+    return FileResponse(str(caminho), media_type=media_type, headers=headers)
+
+@app.get("/avatars/{ref}")
+def servir_avatar(request: Request, ref: str):
+    return _servir_avatar(request, ref, miniatura=False)
+
+@app.get("/avatars/mini/{ref}")
+def servir_avatar_miniatura(request: Request, ref: str):
+    return _servir_avatar(request, ref, miniatura=True)
+
+# ==============================================================================
+# 6. DADOS
+# ==============================================================================
+@app.get("/api/dados/distribuicoes")
+def distribuicoes_dados(request: Request):
+    # Tabelas fixas (só mudam com um deploy novo): o navegador guarda e revalida pelo ETag
+    corpo, etag = dados.tabelas_json()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
+
+@app.post("/api/personagem/{char_id}/rolar")
+async def rolar_atributo(request: Request, char_id: int, data: dict = Body(...), session: AsyncSession = Depends(get_async_session)):
+    user = await get_current_user(request, session)
+    if not user:
+        return {"status": "error", "message": "Não autenticado"}
+
+    try:
+        atributos, quantidade = dados.ler_pedido(data)
+    except dados.PedidoInvalido as e:
+        return {"status": "error", "message": str(e)}
+
+    # Dado, expertise, incapacidade e bônus vêm da ficha, não do cliente
+    colunas = [c for atributo in atributos for c in dados.colunas_do_atributo(atributo)]
+    ficha = (await session.exec(
+        select(Personagem.usuario_id, *[getattr(Personagem, c) for c in colunas]).where(Personagem.id == char_id)
+    )).first()
+    if not ficha or ficha.usuario_id != user.id:
+        return {"status": "error", "message": "Personagem não encontrado ou sem permissão"}
+    await session.close()
+
+    resultados = []
+    try:
+        for atributo in atributos:
+            dado, exp, inc, bonus = dados.dados_do_atributo(ficha, atributo)
+            formula = dados.formula(dado, exp, inc, bonus)
+            rolagens = dados.rolar(dado, exp, inc, bonus, quantidade)
+            resultados.append({
+                "atributo": atributo,
+                "formula": formula,
+                "rolagens": rolagens,
+                "auditoria": dados.auditoria(char_id, user.username, atributo, formula, rolagens),
+            })
+    except dados.PedidoInvalido as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", "resultados": resultados}
+
+@app.post("/api/dados/conferir")
+def conferir_rolagem(registro: dict = Body(...)):
+    # O mestre cola o registro de auditoria recebido e confere a assinatura
+    valido = dados.conferir_auditoria(registro)
+    if valido is None:
+        return {"status": "error", "message": "Registro sem assinatura"}
+    return {"status": "success", "valido": valido}
+
+# Módulo carregado: imports, app, middlewares e rotas
+partida.relatorio.registrar("imports", _INICIO)
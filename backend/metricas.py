@@ -0,0 +1,257 @@
+import ipaddress
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS (FORMATO TEXTO DO PROMETHEUS)
+# ==============================================================================
+# Um middleware ASGI mede cada requisição por rota (o molde "/ficha/{char_id}",
+# não a URL, para não explodir o número de séries). Os eventos da engine somam
+# quantos SQL e quanto tempo de banco cada requisição gastou, via ContextVar:
+# o SQLAlchemy repassa o contexto para o greenlet do driver assíncrono e o
+# run_in_threadpool também, então a conta cai na requisição certa.
+
+SQL_LENTO = float(os.environ.get("GIHARAD_SQL_LENTO_MS", "200")) / 1000
+METRICAS_LIBERADAS = os.environ.get("GIHARAD_METRICAS_LIBERADAS", "").strip().lower() in ("1", "true", "yes", "sim", "on")
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+BUCKETS_QTD_SQL = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes, valores, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    def __init__(self, nome: str, ajuda: str, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valores=(), quantidade: float = 1.0):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0.0) + quantidade
+
+    def expor(self) -> list:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for valores, total in sorted(self._valores.items()):
+                linhas.append(f"{self.nome}{_rotulos(self.rotulos, valores)} {total:g}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, ajuda: str, rotulos=(), buckets=BUCKETS_HTTP):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        self._series = {}  # valores -> [contagens por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, valores=()):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def expor(self) -> list:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            for valores, serie in sorted(self._series.items()):
+                for limite, contagem in zip(self.buckets, serie):
+                    le = 'le="%g"' % limite
+                    linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, valores, le)} {contagem}")
+                le = 'le="+Inf"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, valores, le)} {serie[-1]}")
+                linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, valores)} {serie[-2]:.6f}")
+                linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, valores)} {serie[-1]}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+        self._coletores = []  # Funções que devolvem [(nome, ajuda, tipo, valor)]
+
+    def adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def coletor(self, funcao: Callable):
+        """Valores lidos na hora da coleta (tamanho de cache, assinantes...)."""
+        self._coletores.append(funcao)
+        return funcao
+
+    def expor(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.expor())
+        for funcao in self._coletores:
+            try:
+                for nome, ajuda, tipo, valor in funcao():
+                    linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", f"{nome} {valor:g}"]
+            except Exception:
+                logger.exception("Coletor de métricas falhou")
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+http_requisicoes = registro.adicionar(Contador(
+    "giharad_http_requisicoes_total", "Requisições HTTP atendidas", ("metodo", "rota", "status")))
+http_duracao = registro.adicionar(Histograma(
+    "giharad_http_duracao_segundos", "Latência das requisições HTTP", ("metodo", "rota"), BUCKETS_HTTP))
+http_consultas = registro.adicionar(Histograma(
+    "giharad_http_sql_por_requisicao", "Quantidade de SQL executados por requisição", ("rota",), BUCKETS_QTD_SQL))
+sql_consultas = registro.adicionar(Contador(
+    "giharad_sql_consultas_total", "SQL executados, por rota que os disparou", ("rota",)))
+sql_tempo = registro.adicionar(Contador(
+    "giharad_sql_segundos_total", "Tempo gasto no banco, por rota que o disparou", ("rota",)))
+sql_duracao = registro.adicionar(Histograma(
+    "giharad_sql_duracao_segundos", "Duração de cada SQL", (), BUCKETS_SQL))
+sql_lentas = registro.adicionar(Contador(
+    "giharad_sql_lentas_total", "SQL acima de GIHARAD_SQL_LENTO_MS", ("rota",)))
+
+
+# ==============================================================================
+# CONTEXTO DA REQUISIÇÃO
+# ==============================================================================
+FORA_DE_REQUISICAO = "(fora de requisição)"
+
+
+class EstatisticaRequisicao:
+    __slots__ = ("scope", "consultas", "tempo_db")
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.consultas = 0
+        self.tempo_db = 0.0
+
+    @property
+    def rota(self) -> str:
+        return rota_do_scope(self.scope) if self.scope is not None else FORA_DE_REQUISICAO
+
+
+_atual: ContextVar[Optional[EstatisticaRequisicao]] = ContextVar("giharad_requisicao", default=None)
+
+
+def rota_do_scope(scope) -> str:
+    # O FastAPI grava a rota casada no scope; Mounts (ex.: /static) deixam o root_path
+    rota = scope.get("route")
+    if rota is not None and getattr(rota, "path", None):
+        return rota.path
+    return scope.get("root_path") or "(sem rota)"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI puro: não bufferiza o corpo (SSE e long-poll passam direto)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        estatistica = EstatisticaRequisicao(scope)
+        token = _atual.set(estatistica)
+        status = 500
+        inicio = time.perf_counter()
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            rota = estatistica.rota
+            http_requisicoes.inc((scope["method"], rota, str(status)))
+            http_duracao.observar(duracao, (scope["method"], rota))
+            http_consultas.observar(estatistica.consultas, (rota,))
+            _atual.reset(token)
+
+
+# ==============================================================================
+# EVENTOS DO SQLALCHEMY
+# ==============================================================================
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("giharad_inicio", []).append(time.perf_counter())
+
+
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get("giharad_inicio")
+    if not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+
+    estatistica = _atual.get()
+    rota = estatistica.rota if estatistica else FORA_DE_REQUISICAO
+    if estatistica:
+        estatistica.consultas += 1
+        estatistica.tempo_db += duracao
+    sql_consultas.inc((rota,))
+    sql_tempo.inc((rota,), duracao)
+    sql_duracao.observar(duracao)
+
+    if duracao >= SQL_LENTO:
+        sql_lentas.inc((rota,))
+        # Só o texto do SQL: os parâmetros podem ter hash de senha
+        logger.warning("SQL lento (%.0f ms) em %s: %s", duracao * 1000, rota, " ".join(statement.split())[:500])
+
+
+def _erro(contexto):
+    # Comando que falhou não passa pelo after_cursor_execute: descarta o início
+    conn = contexto.connection
+    if conn is not None and conn.info.get("giharad_inicio"):
+        conn.info["giharad_inicio"].pop()
+
+
+def instrumentar_engine(engine):
+    """Liga a contagem de SQL numa engine síncrona (para a assíncrona, passe .sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _antes)
+    event.listen(engine, "after_cursor_execute", _depois)
+    event.listen(engine, "handle_error", _erro)
+
+
+# ==============================================================================
+# ACESSO AO /metrics
+# ==============================================================================
+def acesso_local(request) -> bool:
+    """/metrics só para a própria máquina, e nunca via túnel/proxy (ngrok conecta de localhost)."""
+    if METRICAS_LIBERADAS:
+        return True
+    if "x-forwarded-for" in request.headers or "x-forwarded-proto" in request.headers:
+        return False
+    host = request.client.host if request.client else ""
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # Sem IP (socket unix, cliente de teste): libere com GIHARAD_METRICAS_LIBERADAS
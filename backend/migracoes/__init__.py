@@ -0,0 +1,116 @@
+import importlib
+import logging
+import pkgutil
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+from .utils import tem_tabela
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# EXECUTOR DE MIGRAÇÕES VERSIONADAS
+# ==============================================================================
+# Cada arquivo mNNNN_descricao.py desta pasta é uma migração com DESCRICAO e
+# aplicar(conn). A versão aplicada fica na tabela schema_versao; um startup
+# normal faz só um SELECT MAX(versao). Com vários workers, só um aplica as
+# pendentes (advisory lock no Postgres, BEGIN IMMEDIATE no SQLite).
+
+TABELA_VERSAO = "schema_versao"
+CHAVE_TRAVA = 7_401_123  # Identificador arbitrário do pg_advisory_lock
+
+_PADRAO_MODULO = re.compile(r"^m(\d{4})_\w+$")
+
+
+def listar_migracoes():
+    """Devolve [(versao, nome, modulo)] em ordem crescente."""
+    migracoes = []
+    for info in pkgutil.iter_modules(__path__):
+        achou = _PADRAO_MODULO.match(info.name)
+        if achou:
+            modulo = importlib.import_module(f"{__name__}.{info.name}")
+            migracoes.append((int(achou.group(1)), info.name, modulo))
+    migracoes.sort(key=lambda m: m[0])
+
+    versoes = [m[0] for m in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise RuntimeError(f"Migrações com número repetido: {versoes}")
+    return migracoes
+
+
+def versao_final() -> int:
+    migracoes = listar_migracoes()
+    return migracoes[-1][0] if migracoes else 0
+
+
+def versao_atual(conn) -> int:
+    if not tem_tabela(conn, TABELA_VERSAO):
+        return 0
+    return conn.execute(text(f"SELECT MAX(versao) FROM {TABELA_VERSAO}")).scalar() or 0
+
+
+def _versao_rapida(engine) -> int:
+    # Caminho do startup normal: uma única consulta, sem inspector
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT MAX(versao) FROM {TABELA_VERSAO}")).scalar() or 0
+    except Exception:
+        return 0
+
+
+def _aplicar_pendentes(conn) -> int:
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {TABELA_VERSAO} ("
+        "versao INTEGER PRIMARY KEY, descricao VARCHAR NOT NULL, aplicada_em VARCHAR NOT NULL)"
+    ))
+    atual = versao_atual(conn)  # Relido já com a trava: outro worker pode ter migrado
+
+    if atual == 0:
+        # Banco novo ou anterior ao versionamento: garante as tabelas do modelo.
+        # As migrações são idempotentes, então rodam por cima sem conflito.
+        SQLModel.metadata.create_all(conn)
+
+    aplicadas = 0
+    for versao, nome, modulo in listar_migracoes():
+        if versao <= atual:
+            continue
+        logger.info("Aplicando migração %s: %s", nome, modulo.DESCRICAO)
+        modulo.aplicar(conn)
+        conn.execute(
+            text(f"INSERT INTO {TABELA_VERSAO} (versao, descricao, aplicada_em) VALUES (:v, :d, :em)"),
+            {"v": versao, "d": modulo.DESCRICAO, "em": datetime.now(timezone.utc).isoformat()},
+        )
+        aplicadas += 1
+    return aplicadas
+
+
+def migrar(engine) -> int:
+    """Aplica as migrações pendentes e devolve quantas foram aplicadas."""
+    from .. import models  # noqa: F401 - registra as tabelas no metadata
+
+    if _versao_rapida(engine) >= versao_final():
+        return 0
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as trava:
+            trava.execute(text("SELECT pg_advisory_lock(:k)"), {"k": CHAVE_TRAVA})
+            try:
+                # DDL no Postgres é transacional: tudo ou nada
+                with engine.begin() as conn:
+                    return _aplicar_pendentes(conn)
+            finally:
+                trava.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": CHAVE_TRAVA})
+
+    # SQLite: BEGIN IMMEDIATE pega a trava de escrita do arquivo logo de início
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            aplicadas = _aplicar_pendentes(conn)
+            conn.exec_driver_sql("COMMIT")
+            return aplicadas
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
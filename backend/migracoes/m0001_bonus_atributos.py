@@ -0,0 +1,8 @@
+from .utils import adicionar_coluna
+
+DESCRICAO = "Bônus/penalidade dos quatro atributos"
+
+
+def aplicar(conn):
+    for atributo in ("fisico", "presenca", "carisma", "astucia"):
+        adicionar_coluna(conn, "personagem", f"bonus_{atributo}", "INTEGER DEFAULT 0")
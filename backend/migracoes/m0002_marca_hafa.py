@@ -0,0 +1,8 @@
+from .utils import adicionar_coluna
+
+DESCRICAO = "Marca do Hafa e Leque do Destino"
+
+
+def aplicar(conn):
+    adicionar_coluna(conn, "personagem", "marca_hafa", "VARCHAR DEFAULT ''")
+    adicionar_coluna(conn, "personagem", "leque_destino", "JSON DEFAULT '[]'")
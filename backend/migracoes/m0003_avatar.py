@@ -0,0 +1,7 @@
+from .utils import adicionar_coluna
+
+DESCRICAO = "Coluna de avatar"
+
+
+def aplicar(conn):
+    adicionar_coluna(conn, "personagem", "avatar", "TEXT DEFAULT ''")
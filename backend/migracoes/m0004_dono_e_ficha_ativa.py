@@ -0,0 +1,8 @@
+from .utils import adicionar_coluna
+
+DESCRICAO = "Dono do personagem (usuario_id) e ficha ativa"
+
+
+def aplicar(conn):
+    adicionar_coluna(conn, "personagem", "usuario_id", "INTEGER DEFAULT NULL")
+    adicionar_coluna(conn, "personagem", "is_active", "BOOLEAN DEFAULT false")
@@ -0,0 +1,16 @@
+import logging
+
+from sqlmodel import Session
+
+from .. import avatars
+
+logger = logging.getLogger(__name__)
+
+DESCRICAO = "Move avatares base64 da coluna para o disco"
+
+
+def aplicar(conn):
+    with Session(bind=conn) as session:
+        migrados = avatars.migrar_avatares_base64(session, commit=False)
+    if migrados:
+        logger.info("%s avatar(es) base64 migrados para o disco.", migrados)
@@ -0,0 +1,7 @@
+from .utils import adicionar_coluna
+
+DESCRICAO = "Versão monotônica do personagem (cache da ficha / ETag)"
+
+
+def aplicar(conn):
+    adicionar_coluna(conn, "personagem", "versao", "INTEGER NOT NULL DEFAULT 0")
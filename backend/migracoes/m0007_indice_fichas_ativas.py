@@ -0,0 +1,11 @@
+from sqlalchemy import text
+
+DESCRICAO = "Índice parcial das fichas ativas (roster)"
+
+
+def aplicar(conn):
+    # O SQLite só usa o índice parcial se o predicado bater com o da consulta
+    # (o SQLAlchemy gera "is_active = 1" lá e "is_active = true" no Postgres).
+    filtro = "is_active = 1" if conn.dialect.name == "sqlite" else "is_active"
+    # IF NOT EXISTS: o banco novo já ganhou o índice pelo create_all
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_personagem_ativos ON personagem (usuario_id) WHERE {filtro}"))
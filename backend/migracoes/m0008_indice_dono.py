@@ -0,0 +1,7 @@
+from sqlalchemy import text
+
+DESCRICAO = "Índice (usuario_id, id) para a listagem paginada da home"
+
+
+def aplicar(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_personagem_dono ON personagem (usuario_id, id)"))
@@ -0,0 +1,13 @@
+from sqlalchemy import text
+
+DESCRICAO = "Tabela alteracao_campo (sincronização por delta e concorrência otimista)"
+
+
+def aplicar(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS alteracao_campo ("
+        "personagem_id INTEGER NOT NULL REFERENCES personagem (id) ON DELETE CASCADE, "
+        "campo VARCHAR NOT NULL, "
+        "versao INTEGER NOT NULL, "
+        "PRIMARY KEY (personagem_id, campo))"
+    ))
@@ -0,0 +1,14 @@
+import logging
+
+from .. import busca
+
+logger = logging.getLogger(__name__)
+
+DESCRICAO = "Índice de busca das fichas (GIN no Postgres, FTS5 no SQLite)"
+
+
+def aplicar(conn):
+    busca.criar(conn)
+    indexadas = busca.reindexar(conn)
+    if indexadas:
+        logger.info("%s ficha(s) indexadas para a busca.", indexadas)
@@ -0,0 +1,15 @@
+import logging
+
+from .. import historico
+from ..models import HistoricoFicha
+
+logger = logging.getLogger(__name__)
+
+DESCRICAO = "Tabela historico_ficha (deltas, snapshots e desfazer)"
+
+
+def aplicar(conn):
+    HistoricoFicha.__table__.create(conn, checkfirst=True)
+    fichas = historico.recriar(conn)
+    if fichas:
+        logger.info("Snapshot inicial do histórico gravado para %s ficha(s).", fichas)
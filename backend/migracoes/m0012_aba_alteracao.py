@@ -0,0 +1,7 @@
+from .utils import adicionar_coluna
+
+DESCRICAO = "Aba que gravou cada campo (alteracao_campo.aba)"
+
+
+def aplicar(conn):
+    adicionar_coluna(conn, "alteracao_campo", "aba", "VARCHAR(64)")
@@ -0,0 +1,18 @@
+from sqlalchemy import inspect, text
+
+# Helpers usados pelas migrações. São idempotentes de propósito: um banco
+# anterior ao controle de versão pode já ter parte das colunas, e um banco novo
+# acabou de ser criado pelo create_all com o schema completo.
+
+
+def colunas(conn, tabela: str) -> set:
+    return {col["name"] for col in inspect(conn).get_columns(tabela)}
+
+
+def tem_tabela(conn, tabela: str) -> bool:
+    return inspect(conn).has_table(tabela)
+
+
+def adicionar_coluna(conn, tabela: str, coluna: str, ddl: str):
+    if coluna not in colunas(conn, tabela):
+        conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {ddl}"))
@@ -1,6 +1,7 @@
+from datetime import datetime, timezone
 from typing import Optional, Dict, List, Any
 from sqlmodel import Field, SQLModel
-from sqlalchemy import JSON, Column # Importamos Column também
+from sqlalchemy import JSON, Column, Index, text # Importamos Column também
 
 # Função atualizada com acentos e separação de Idioma/Atuação
 def default_competencias():
@@ -17,8 +18,21 @@ class Usuario(SQLModel, table=True):
     password_hash: str
 
 class Personagem(SQLModel, table=True):
+    # eager_defaults: o novo valor de 'versao' volta no próprio UPDATE (RETURNING)
+    __mapper_args__ = {"eager_defaults": True}
+    # Índice parcial: só as poucas fichas ativas entram nele (roster e ativação)
+    __table_args__ = (
+        Index("ix_personagem_ativos", "usuario_id", postgresql_where=text("is_active"), sqlite_where=text("is_active = 1")),
+        # Listagem da home: WHERE usuario_id = ? ORDER BY id LIMIT ...
+        Index("ix_personagem_dono", "usuario_id", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     usuario_id: Optional[int] = Field(default=None, foreign_key="usuario.id")
+
+    # Incrementada pelo banco em todo UPDATE (ORM ou core), inclusive os em lote.
+    # Serve de chave para o cache da ficha renderizada e para o ETag.
+    versao: int = Field(default=0, sa_column_kwargs={"server_default": "0", "onupdate": text("versao + 1")})
     
     nome: str
     jogador: str
@@ -116,4 +130,30 @@ class Personagem(SQLModel, table=True):
     slots_nv6: int = Field(default=0)
     slots_nv6_max: int = Field(default=0)
     
-    magias: List[Dict[str, Any]] = Field(default_factory=list, sa_column=Column(JSON))
\ No newline at end of file
+    magias: List[Dict[str, Any]] = Field(default_factory=list, sa_column=Column(JSON))
+
+
+class AlteracaoCampo(SQLModel, table=True):
+    """Última versão em que cada campo de um personagem mudou (sincronização por delta)."""
+    __tablename__ = "alteracao_campo"
+
+    personagem_id: int = Field(foreign_key="personagem.id", primary_key=True, ondelete="CASCADE")
+    campo: str = Field(primary_key=True)
+    versao: int
+    # Aba (página aberta) que gravou: a própria aba não entra em conflito consigo mesma
+    aba: Optional[str] = Field(default=None, max_length=64)
+
+class HistoricoFicha(SQLModel, table=True):
+    """Histórico da ficha: deltas (só os campos gravados) e snapshots (estado completo)."""
+    __tablename__ = "historico_ficha"
+    # Reconstrução e desfazer: WHERE personagem_id = ? ORDER BY versao
+    __table_args__ = (Index("ix_historico_ficha_versao", "personagem_id", "versao"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    personagem_id: int = Field(foreign_key="personagem.id", ondelete="CASCADE")
+    versao: int  # Versão da ficha depois desta escrita
+    tipo: str  # "delta" | "snapshot"
+    origem: str = Field(default="edicao")  # edicao | desfazer | refazer
+    alvo: Optional[int] = Field(default=None)  # Entrada desfeita/refeita
+    em: datetime = Field(default_factory=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    campos: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
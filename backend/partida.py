@@ -0,0 +1,81 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from jinja2 import FileSystemBytecodeCache
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# PARTIDA DO WORKER (CACHE DE TEMPLATES E TEMPOS DE STARTUP)
+# ==============================================================================
+# O primeiro acesso à ficha depois de um restart pagava a compilação do
+# ficha.html (~100 KB de Jinja). Agora:
+#   - o bytecode compilado fica em disco (data/jinja_cache): um worker novo só
+#     carrega, e o Jinja recompila sozinho quando o template muda;
+#   - os templates são carregados no lifespan, antes da primeira requisição;
+#   - cada fase do startup é cronometrada e vai para o log e o /metrics.
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# Vazio desliga o cache em disco (só o cache em memória do Jinja)
+CACHE_TEMPLATES_DIR = os.environ.get("GIHARAD_JINJA_CACHE_DIR", str(BASE_DIR / "data" / "jinja_cache"))
+AQUECER_TEMPLATES = os.environ.get("GIHARAD_AQUECER_TEMPLATES", "1").lower() not in ("0", "false", "no")
+
+
+def configurar_cache_templates(ambiente) -> Optional[Path]:
+    """Liga o FileSystemBytecodeCache no Environment (antes do primeiro get_template)."""
+    if not CACHE_TEMPLATES_DIR:
+        return None
+    pasta = Path(CACHE_TEMPLATES_DIR)
+    try:
+        pasta.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        logger.warning("Sem acesso a %s; templates compilados só em memória", pasta)
+        return None
+    ambiente.bytecode_cache = FileSystemBytecodeCache(str(pasta), "giharad-%s.cache")
+    return pasta
+
+
+def aquecer_templates(ambiente) -> list:
+    """Carrega (e compila, se o cache em disco não tiver) todos os templates."""
+    nomes = [nome for nome in ambiente.list_templates() if nome.endswith(".html")]
+    for nome in nomes:
+        ambiente.get_template(nome)
+    return nomes
+
+
+class RelatorioPartida:
+    """Duração de cada fase do startup, na ordem em que aconteceram."""
+
+    def __init__(self):
+        self.fases = {}  # nome -> segundos
+
+    def registrar(self, nome: str, inicio: float):
+        self.fases[nome] = time.perf_counter() - inicio
+
+    @contextmanager
+    def fase(self, nome: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, inicio)
+
+    def total(self) -> float:
+        return sum(self.fases.values())
+
+    def resumo(self) -> str:
+        partes = ", ".join(f"{nome} {segundos * 1000:.0f} ms" for nome, segundos in self.fases.items())
+        return f"Partida em {self.total() * 1000:.0f} ms ({partes})"
+
+    def metricas(self) -> list:
+        linhas = [("giharad_partida_segundos", "Duração total do startup do worker", "gauge", self.total())]
+        for nome, segundos in self.fases.items():
+            linhas.append((f"giharad_partida_{nome}_segundos", f"Startup: fase '{nome}'", "gauge", segundos))
+        return linhas
+
+
+relatorio = RelatorioPartida()
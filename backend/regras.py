@@ -0,0 +1,169 @@
+from types import SimpleNamespace
+from typing import Optional
+
+# ==============================================================================
+# REGRAS DE PROGRESSÃO E DESCANSO
+# ==============================================================================
+# Mesmas contas que a ficha fazia no navegador (levelUpFicha, recalcularAtributos,
+# abrirModalDescanso), agora no servidor: cada operação lê só as colunas que
+# usa, calcula os novos valores e main.py grava tudo num único UPDATE.
+
+NIVEL_MAXIMO = 20
+LIMITE_DESCANSOS_CURTOS = 2
+
+# Classe -> (PV, PA) ganhos por nível; também são os valores do nível 1
+GANHOS_CLASSE = {
+    "Combatente": (6, 5),
+    "Mentor": (4, 6),
+    "Conjurador": (4, 3),
+    "Zelote": (5, 4),
+}
+
+# Passos do dado de Físico acima do d4: somam PV (e limite de carga)
+PASSOS_FISICO = {4: 0, 6: 1, 8: 2, 10: 3, 12: 4, 20: 5}
+
+CLASSES_MAGICAS = ("Conjurador", "Zelote")
+NIVEIS_MAGIA = range(1, 7)
+# Espaços de feitiço por círculo (1º ao 6º) a cada faixa de nível
+ESPACOS_MAGIA = [
+    (1, (1, 0, 0, 0, 0, 0)),
+    (3, (2, 1, 0, 0, 0, 0)),
+    (6, (3, 2, 1, 0, 0, 0)),
+    (9, (4, 3, 2, 1, 0, 0)),
+    (12, (5, 4, 3, 2, 1, 0)),
+    (15, (6, 5, 4, 3, 2, 1)),
+    (18, (7, 6, 5, 4, 3, 2)),
+]
+
+# Descanso longo: quanto soma além da metade do máximo (None = recupera tudo)
+QUALIDADES_DESCANSO = {
+    "ruim": lambda nivel: 0,
+    "normal": lambda nivel: nivel,
+    "confortavel": lambda nivel: 2 * nivel,
+    "luxuoso": None,
+}
+
+SLOTS = [f"slots_nv{i}" for i in NIVEIS_MAGIA]
+SLOTS_MAX = [f"slots_nv{i}_max" for i in NIVEIS_MAGIA]
+
+
+class RegraInvalida(ValueError):
+    pass
+
+
+def passos_fisico(fisico) -> int:
+    return PASSOS_FISICO.get(fisico or 4, 0)
+
+
+def espacos_magia(classe: str, nivel: int) -> tuple:
+    if classe not in CLASSES_MAGICAS:
+        return (0,) * len(SLOTS)
+    espacos = (0,) * len(SLOTS)
+    for a_partir_de, linha in ESPACOS_MAGIA:
+        if nivel >= a_partir_de:
+            espacos = linha
+    return espacos
+
+
+def normalizar(linha, colunas) -> SimpleNamespace:
+    """Só as colunas da operação, com NULL (fichas antigas) virando 0 e nível mínimo 1."""
+    valores = {c: getattr(linha, c) for c in colunas}
+    for coluna, valor in valores.items():
+        if coluna != "classe":
+            valores[coluna] = valor or 0
+    if "nivel" in valores:
+        valores["nivel"] = min(max(valores["nivel"], 1), NIVEL_MAXIMO)
+    return SimpleNamespace(**valores)
+
+
+def _ganhos(ficha) -> tuple:
+    ganhos = GANHOS_CLASSE.get(ficha.classe)
+    if ganhos is None:
+        raise RegraInvalida("Escolha uma Classe antes")
+    return ganhos
+
+
+def _derivados_do_nivel(classe: str, nivel: int) -> dict:
+    # PG/PH máximos e espaços de feitiço dependem só de classe e nível
+    valores = {"pg_max": nivel * 2, "ph_max": nivel * 2}
+    valores.update(zip(SLOTS_MAX, espacos_magia(classe, nivel)))
+    return valores
+
+
+# ==============================================================================
+# OPERAÇÕES (cada uma recebe a linha lida e devolve {coluna: novo valor})
+# ==============================================================================
+def evoluir(ficha, dados: dict) -> dict:
+    """Sobe um nível: soma os ganhos da classe no máximo e no atual de PV/PA."""
+    pv, pa = _ganhos(ficha)
+    if ficha.nivel >= NIVEL_MAXIMO:
+        raise RegraInvalida(f"A ficha já está no nível máximo ({NIVEL_MAXIMO})")
+    nivel = ficha.nivel + 1
+    return {
+        "nivel": nivel,
+        "pv_max": ficha.pv_max + pv,
+        "pv_atual": ficha.pv_atual + pv,
+        "pa_max": ficha.pa_max + pa,
+        "pa_atual": ficha.pa_atual + pa,
+        **_derivados_do_nivel(ficha.classe, nivel),
+    }
+
+
+def recalcular(ficha, dados: dict) -> dict:
+    """Refaz os máximos a partir de classe, nível e Físico (sobrescreve ajustes manuais)."""
+    pv, pa = _ganhos(ficha)
+    return {
+        "pv_max": pv * ficha.nivel + passos_fisico(ficha.fisico),
+        "pa_max": pa * ficha.nivel,
+        **_derivados_do_nivel(ficha.classe, ficha.nivel),
+    }
+
+
+def descanso_curto(ficha, dados: dict) -> dict:
+    pv, pa = _ganhos(ficha)
+    if ficha.descansos_curtos >= LIMITE_DESCANSOS_CURTOS:
+        raise RegraInvalida("Limite de descansos curtos atingido")
+    return {
+        "pv_atual": min(ficha.pv_atual + pv + passos_fisico(ficha.fisico), ficha.pv_max + ficha.pv_bonus),
+        "pa_atual": min(ficha.pa_atual + pa, ficha.pa_max + ficha.pa_bonus),
+        "descansos_curtos": ficha.descansos_curtos + 1,
+    }
+
+
+def descanso_longo(ficha, dados: dict) -> dict:
+    """Recupera PV/PA conforme a qualidade, zera os descansos curtos e repõe os feitiços."""
+    _ganhos(ficha)
+    qualidade = str(dados.get("qualidade", "normal")).lower().replace("á", "a")
+    if qualidade not in QUALIDADES_DESCANSO:
+        raise RegraInvalida(f"Qualidade de descanso inválida: {qualidade}")
+
+    teto_pv = ficha.pv_max + ficha.pv_bonus
+    teto_pa = ficha.pa_max + ficha.pa_bonus
+    extra = QUALIDADES_DESCANSO[qualidade]
+    if extra is None:
+        pv_atual, pa_atual = teto_pv, teto_pa
+    else:
+        bonus = extra(ficha.nivel)
+        pv_atual = min(ficha.pv_atual + ficha.pv_max // 2 + bonus + passos_fisico(ficha.fisico), teto_pv)
+        pa_atual = min(ficha.pa_atual + ficha.pa_max // 2 + bonus, teto_pa)
+
+    valores = {"pv_atual": pv_atual, "pa_atual": pa_atual, "descansos_curtos": 0}
+    valores.update({slot: getattr(ficha, maximo) for slot, maximo in zip(SLOTS, SLOTS_MAX)})
+    return valores
+
+
+# Operação -> (função, colunas que ela lê)
+OPERACOES = {
+    "evoluir": (evoluir, ["classe", "nivel", "pv_max", "pv_atual", "pa_max", "pa_atual"]),
+    "recalcular": (recalcular, ["classe", "nivel", "fisico"]),
+    "descanso_curto": (descanso_curto, [
+        "classe", "fisico", "descansos_curtos", "pv_atual", "pv_max", "pv_bonus", "pa_atual", "pa_max", "pa_bonus",
+    ]),
+    "descanso_longo": (descanso_longo, [
+        "classe", "nivel", "fisico", "pv_atual", "pv_max", "pv_bonus", "pa_atual", "pa_max", "pa_bonus", *SLOTS_MAX,
+    ]),
+}
+
+
+def operacao(nome: str) -> Optional[tuple]:
+    return OPERACOES.get(nome)
@@ -0,0 +1,45 @@
+import os
+
+from sqlmodel import select
+
+from .models import Personagem
+
+# ==============================================================================
+# RESUMO DAS FICHAS (HOME)
+# ==============================================================================
+# A home só mostra uma carta por personagem. Em vez de hidratar o Personagem
+# inteiro (magias, inventário, notas...), lemos apenas as colunas da carta.
+
+CAMPOS_CARTA = (
+    "id", "nome", "raca", "classe", "nivel", "is_active", "avatar",
+    "pv_atual", "pv_max", "pa_atual", "pa_max",
+    "ph_atual", "ph_max", "pg_atual", "pg_max",
+)
+
+FICHAS_POR_PAGINA = int(os.environ.get("GIHARAD_FICHAS_POR_PAGINA", "24"))
+
+
+def consulta_cartas(usuario_id: int, pagina: int = 1, por_pagina: int = FICHAS_POR_PAGINA):
+    """Uma página de cartas do usuário, ordenadas por id (índice ix_personagem_dono).
+
+    Pede uma linha a mais que o tamanho da página: se ela vier, existe próxima
+    página, sem precisar de um COUNT(*).
+    """
+    pagina = max(pagina, 1)
+    return (
+        select(*[getattr(Personagem, campo) for campo in CAMPOS_CARTA])
+        .where(Personagem.usuario_id == usuario_id)
+        .order_by(Personagem.id)
+        .offset((pagina - 1) * por_pagina)
+        .limit(por_pagina + 1)
+    )
+
+
+def paginar(linhas, pagina: int, por_pagina: int = FICHAS_POR_PAGINA) -> dict:
+    pagina = max(pagina, 1)
+    return {
+        "itens": linhas[:por_pagina],
+        "pagina": pagina,
+        "anterior": pagina - 1 if pagina > 1 else None,
+        "proxima": pagina + 1 if len(linhas) > por_pagina else None,
+    }
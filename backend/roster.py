@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlmodel import select
+
+from . import avatars
+from .difusao import difusao
+from .eventos import barramento
+from .models import Personagem, Usuario
+
+# ==============================================================================
+# ROSTER DE FICHAS ATIVAS (DIFS EM TEMPO REAL)
+# ==============================================================================
+TOPICO_ROSTER = "roster"
+
+# Campos do Personagem que aparecem nas cartas flutuantes
+CAMPOS_ROSTER = (
+    "nome", "raca", "classe", "nivel", "avatar",
+    "pv_atual", "pv_max", "pa_atual", "pa_max",
+    "ph_atual", "ph_max", "pg_atual", "pg_max",
+)
+
+# Com vários workers cada um só vê as próprias escritas; depois deste tempo o
+# snapshot em memória é relido do banco (índice parcial, só colunas do resumo).
+ROSTER_TTL = float(os.environ.get("GIHARAD_ROSTER_TTL", "60"))
+
+
+def consulta_roster(char_id: Optional[int] = None):
+    """SELECT apenas das colunas do resumo (sem JSONs) + username do dono."""
+    colunas = [Personagem.id, Personagem.jogador] + [getattr(Personagem, c) for c in CAMPOS_ROSTER]
+    stmt = select(*colunas, Usuario.username).outerjoin(Usuario, Personagem.usuario_id == Usuario.id)
+    if char_id is not None:
+        return stmt.where(Personagem.id == char_id)
+    return stmt.where(Personagem.is_active == True).order_by(Personagem.id)
+
+
+def resumo_roster(p, username=None) -> dict:
+    return {
+        "id": p.id,
+        "nome": p.nome,
+        "jogador": username if username else (p.jogador or "Sem Conta"),
+        "raca": p.raca,
+        "classe": p.classe,
+        "nivel": p.nivel,
+        "avatar": avatars.url_miniatura(p.avatar),
+        "pv_atual": p.pv_atual,
+        "pv_max": p.pv_max,
+        "pa_atual": p.pa_atual,
+        "pa_max": p.pa_max,
+        "ph_atual": p.ph_atual,
+        "ph_max": p.ph_max,
+        "pg_atual": p.pg_atual,
+        "pg_max": p.pg_max,
+    }
+
+
+class Roster:
+    """Guarda o último estado enviado de cada ficha ativa para publicar só as diferenças."""
+
+    def __init__(self, ttl: float = ROSTER_TTL):
+        self._estado = {}  # char_id -> resumo
+        self._ttl = ttl
+        self._carregado_em = None
+        self._mutacoes = 0  # Sobe a cada escrita; detecta carga que ficou velha no caminho
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Optional[list]:
+        """Lista atual das fichas ativas, ou None se precisa ser (re)lida do banco."""
+        with self._lock:
+            if self._carregado_em is None or time.monotonic() - self._carregado_em > self._ttl:
+                return None
+            return [dict(r) for r in self._estado.values()]
+
+    def marca(self) -> int:
+        # Pegue antes de consultar o banco e devolva em semear()
+        with self._lock:
+            return self._mutacoes
+
+    def semear(self, resumos, marca: Optional[int] = None) -> bool:
+        with self._lock:
+            if marca is not None and marca != self._mutacoes:
+                return False  # Houve escrita durante a consulta; a próxima leitura recarrega
+            self._estado = {r["id"]: dict(r) for r in resumos}
+            self._carregado_em = time.monotonic()
+            return True
+
+    def invalidar(self):
+        with self._lock:
+            self._carregado_em = None
+
+    def entrar(self, resumo: dict):
+        with self._lock:
+            self._estado[resumo["id"]] = dict(resumo)
+            self._mutacoes += 1
+        self._publicar({"tipo": "entrada", "ficha": resumo})
+
+    def sair(self, char_id: int):
+        with self._lock:
+            self._estado.pop(char_id, None)
+            self._mutacoes += 1
+        self._publicar({"tipo": "saida", "id": char_id})
+
+    def alterar(self, char_id: int, campos: dict):
+        """Recebe campos crus do Personagem; publica apenas o que mudou no roster."""
+        visiveis = {c: v for c, v in campos.items() if c in CAMPOS_ROSTER}
+        if not visiveis:
+            return
+        if "avatar" in visiveis:
+            visiveis["avatar"] = avatars.url_miniatura(visiveis["avatar"])
+
+        with self._lock:
+            self._mutacoes += 1
+            atual = self._estado.get(char_id)
+            if atual is not None:
+                diff = {c: v for c, v in visiveis.items() if atual.get(c) != v}
+                atual.update(diff)
+        if atual is None:
+            # Fora do roster deste worker (inativa, ou roster ainda não carregado aqui):
+            # os outros podem tê-la na lista, e quem não tiver ignora o patch
+            difusao.enviar("roster", {"tipo": "patch", "id": char_id, "campos": visiveis})
+            return
+        if diff:
+            self._publicar({"tipo": "patch", "id": char_id, "campos": diff})
+
+    def _publicar(self, evento: dict):
+        barramento.publicar(TOPICO_ROSTER, evento)
+        difusao.enviar("roster", evento)  # Os outros workers aplicam com aplicar_remoto()
+
+    def aplicar_remoto(self, evento: dict):
+        """Evento de roster vindo de outro worker: atualiza o estado e avisa só os clientes locais."""
+        tipo = evento.get("tipo")
+        with self._lock:
+            self._mutacoes += 1
+            if tipo == "entrada":
+                self._estado[evento["ficha"]["id"]] = dict(evento["ficha"])
+            elif tipo == "saida":
+                self._estado.pop(evento["id"], None)
+            elif tipo == "patch":
+                atual = self._estado.get(evento["id"])
+                if atual is not None:
+                    atual.update(evento["campos"])
+            else:
+                return
+        barramento.publicar(TOPICO_ROSTER, evento)
+
+    def ressincronizar(self):
+        # Eventos podem ter se perdido: relê do banco e manda um snapshot novo aos clientes
+        self.invalidar()
+        barramento.publicar(TOPICO_ROSTER, {"tipo": "resync"})
+
+
+roster = Roster()
+difusao.tratador("roster")(roster.aplicar_remoto)
+difusao.tratador("resync")(lambda _dados: roster.ressincronizar())
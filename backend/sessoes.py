@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+# ==============================================================================
+# SESSÕES ASSINADAS + CACHE DE USUÁRIOS
+# ==============================================================================
+# O cookie carrega {uid, username, exp} assinado com HMAC-SHA256. Como não dá
+# para forjar, não precisamos ir ao banco só para descobrir quem está chamando:
+# o usuário resolvido fica num cache LRU com TTL.
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ARQUIVO_SEGREDO = Path(os.environ.get("GIHARAD_SECRET_FILE", BASE_DIR / "data" / "secret_key"))
+
+NOME_COOKIE = "giharad_sessao"
+COOKIE_LEGADO = "giharad_user_id"
+DURACAO_SESSAO = int(os.environ.get("GIHARAD_SESSAO_HORAS", "720")) * 3600  # 30 dias
+
+CACHE_MAX_USUARIOS = int(os.environ.get("GIHARAD_CACHE_USUARIOS", "1024"))
+CACHE_TTL = int(os.environ.get("GIHARAD_CACHE_USUARIOS_TTL", "300"))  # segundos
+
+
+def _carregar_segredo() -> bytes:
+    # Prioridade: variável de ambiente; senão um arquivo gerado uma única vez,
+    # para que reinícios e vários workers aceitem os mesmos tokens.
+    do_ambiente = os.environ.get("GIHARAD_SECRET_KEY")
+    if do_ambiente:
+        return do_ambiente.encode()
+    if ARQUIVO_SEGREDO.exists():
+        return ARQUIVO_SEGREDO.read_bytes().strip()
+
+    ARQUIVO_SEGREDO.parent.mkdir(parents=True, exist_ok=True)
+    novo = secrets.token_hex(32).encode()
+    try:
+        # O_EXCL: se outro worker criou o arquivo ao mesmo tempo, usamos o dele
+        fd = os.open(ARQUIVO_SEGREDO, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(novo)
+        return novo
+    except FileExistsError:
+        return ARQUIVO_SEGREDO.read_bytes().strip()
+
+
+SEGREDO = _carregar_segredo()
+# Chave própria dos registros (derivada): uma assinatura de registro nunca vale como cookie
+CHAVE_REGISTROS = hmac.new(SEGREDO, b"giharad:registro", hashlib.sha256).digest()
+
+
+def _b64(dados: bytes) -> str:
+    return base64.urlsafe_b64encode(dados).rstrip(b"=").decode()
+
+
+def _unb64(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _assinar(corpo: str) -> str:
+    return _b64(hmac.new(SEGREDO, corpo.encode(), hashlib.sha256).digest())
+
+
+def emitir_token(user_id: int, username: str) -> str:
+    payload = {"uid": user_id, "u": username, "exp": int(time.time()) + DURACAO_SESSAO}
+    corpo = _b64(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode())
+    return f"{corpo}.{_assinar(corpo)}"
+
+
+def assinar_registro(registro: dict) -> str:
+    """Assinatura de um registro (ex.: auditoria de rolagem), com chave separada da dos cookies."""
+    corpo = json.dumps(registro, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return _b64(hmac.new(CHAVE_REGISTROS, corpo.encode(), hashlib.sha256).digest())
+
+
+def ler_token(token: Optional[str]) -> Optional[dict]:
+    """Devolve o payload se a assinatura confere e o token não expirou."""
+    if not token or token.count(".") != 1:
+        return None
+    corpo, assinatura = token.split(".")
+    if not hmac.compare_digest(assinatura, _assinar(corpo)):
+        return None
+    try:
+        payload = json.loads(_unb64(corpo))
+    except ValueError:
+        return None
+    if not isinstance(payload.get("uid"), int) or payload.get("exp", 0) < time.time():
+        return None
+    return payload
+
+
+@dataclass(frozen=True)
+class UsuarioSessao:
+    """Só o que as rotas precisam do Usuario (nunca o hash da senha)."""
+    id: int
+    username: str
+
+
+class CacheUsuarios:
+    def __init__(self, maximo: int = CACHE_MAX_USUARIOS, ttl: int = CACHE_TTL):
+        self._maximo = maximo
+        self._ttl = ttl
+        self._itens = OrderedDict()  # uid -> (expira_em, UsuarioSessao)
+        self._lock = threading.Lock()
+
+    def obter(self, user_id: int) -> Optional[UsuarioSessao]:
+        with self._lock:
+            item = self._itens.get(user_id)
+            if item is None:
+                return None
+            expira_em, usuario = item
+            if expira_em < time.monotonic():
+                del self._itens[user_id]
+                return None
+            self._itens.move_to_end(user_id)
+            return usuario
+
+    def guardar(self, usuario: UsuarioSessao):
+        with self._lock:
+            self._itens[usuario.id] = (time.monotonic() + self._ttl, usuario)
+            self._itens.move_to_end(usuario.id)
+            while len(self._itens) > self._maximo:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, user_id: int):
+        with self._lock:
+            self._itens.pop(user_id, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+cache_usuarios = CacheUsuarios()
+
+
+def definir_cookie_sessao(resp, request, user_id: int, username: str):
+    resp.set_cookie(
+        key=NOME_COOKIE,
+        value=emitir_token(user_id, username),
+        max_age=DURACAO_SESSAO,
+        httponly=True,
+        samesite="lax",
+        secure=(request.url.scheme == "https"),
+    )
+    # O cookie antigo (id cru) não é mais aceito; limpamos para não confundir
+    resp.delete_cookie(COOKIE_LEGADO)
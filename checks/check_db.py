@@ -2,15 +2,15 @@ from sqlmodel import Session, select
 from backend.models import Personagem, Usuario
 from backend.database import engine
 
-with Session(engine) as session:
-    chars = session.exec(select(Personagem)).all()
-    users = session.exec(select(Usuario)).all()
+# Só as colunas impressas, lidas em lotes: a memória não cresce com o número de fichas
+with Session(engine) as session, open('db_dump.txt', 'w', encoding='utf-8') as out:
+    lote = {"stream_results": True, "yield_per": 500}
 
-    with open('db_dump.txt', 'w', encoding='utf-8') as out:
-        out.write('USERS:\n')
-        for u in users:
-            out.write(f'{u.id}: {u.username}\n')
-            
-        out.write('\nCHARS:\n')
-        for c in chars:
-            out.write(f'{c.id}: {c.nome} (User: {c.usuario_id})\n')
+    out.write('USERS:\n')
+    for u in session.exec(select(Usuario.id, Usuario.username).order_by(Usuario.id).execution_options(**lote)):
+        out.write(f'{u.id}: {u.username}\n')
+
+    out.write('\nCHARS:\n')
+    stmt = select(Personagem.id, Personagem.nome, Personagem.usuario_id).order_by(Personagem.id)
+    for c in session.exec(stmt.execution_options(**lote)):
+        out.write(f'{c.id}: {c.nome} (User: {c.usuario_id})\n')
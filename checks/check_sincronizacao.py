@@ -0,0 +1,197 @@
+"""Checagens da sincronização da ficha (escrita adiada, conflitos, histórico, difusão).
+
+Roda em processo (ASGI, sem rede) contra um SQLite temporário:
+
+    python checks/check_sincronizacao.py
+
+Cada checagem imprime "ok" ou para no primeiro AssertionError.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+# Antes de importar o backend: a engine e as configurações são lidas no import
+PASTA = Path(tempfile.mkdtemp(prefix="giharad-check-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{PASTA / 'check.db'}"
+os.environ["GIHARAD_SECRET_FILE"] = str(PASTA / "secret_key")
+os.environ["GIHARAD_AVATAR_DIR"] = str(PASTA / "avatars")
+os.environ["GIHARAD_JINJA_CACHE_DIR"] = ""
+os.environ["GIHARAD_ESCRITA_ADIADA"] = "memoria"
+os.environ["GIHARAD_ESCRITA_ADIADA_MS"] = "200"
+os.environ["GIHARAD_DIFUSAO"] = "desligada"  # Ligada à mão, em checar_difusao_roster
+os.environ["GIHARAD_METRICAS_LIBERADAS"] = "1"  # O cliente ASGI não tem IP de loopback
+
+import httpx
+
+from backend.difusao import Difusao, TransporteMemoria, difusao
+from backend.main import app
+from backend.roster import Roster, roster
+
+ESPERA_LOTE = 0.6  # Segundos: mais que GIHARAD_ESCRITA_ADIADA_MS
+
+
+def cliente():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://check", timeout=30)
+
+
+async def criar_jogador(http, nome: str) -> int:
+    await http.post("/register", data={"username": nome, "password": "check", "confirm_password": "check"})
+    resposta = await http.get("/novo")
+    return int(resposta.headers["location"].rstrip("/").rsplit("/", 1)[-1])
+
+
+async def campos_atuais(http, char_id: int) -> dict:
+    return (await http.get(f"/api/personagem/{char_id}/changes?since=0")).json()["campos"]
+
+
+async def esperar(condicao, limite: float = 2.0) -> bool:
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if condicao():
+            return True
+        await asyncio.sleep(0.02)
+    return condicao()
+
+
+# ==============================================================================
+# ESCRITA ADIADA
+# ==============================================================================
+async def checar_contador_antes_de_ativar(http):
+    await http.get("/api/active_characters")  # Roster carregado, como numa mesa aberta
+    char_id = await criar_jogador(http, "adiada_ativar")
+    resposta = (await http.post(f"/api/atualizar_campo/{char_id}", json={"pv_atual": 5})).json()
+    assert resposta.get("adiado"), resposta
+    await http.post(f"/api/personagem/{char_id}/active")
+    await asyncio.sleep(ESPERA_LOTE)
+
+    fichas = {f["id"]: f for f in (await http.get("/api/active_characters")).json()["data"]}
+    assert fichas[char_id]["pv_atual"] == 5, fichas[char_id]
+    assert (await campos_atuais(http, char_id))["pv_atual"] == 5
+
+
+async def checar_contador_antes_da_regra(http):
+    char_id = await criar_jogador(http, "adiada_regra")
+    await http.post(f"/api/atualizar_campo/{char_id}", json={"classe": "Combatente"})
+    assert (await http.post(f"/api/atualizar_campo/{char_id}", json={"pv_atual": 3})).json().get("adiado")
+
+    # Evoluir soma 6 de PV (Combatente) ao atual: parte do clique pendente, não do banco
+    resposta = (await http.post(f"/api/personagem/{char_id}/regras/evoluir", json={})).json()
+    assert resposta["campos"]["pv_atual"] == 9, resposta
+    await asyncio.sleep(ESPERA_LOTE)
+    assert (await campos_atuais(http, char_id))["pv_atual"] == 9  # O lote não atropelou a regra
+
+
+# ==============================================================================
+# CONCORRÊNCIA OTIMISTA E HISTÓRICO
+# ==============================================================================
+async def checar_conflito_versao(http):
+    char_id = await criar_jogador(http, "conflito")
+    versao = (await http.post(f"/api/atualizar_campo/{char_id}", json={"notas": "aba 1"})).json()["versao"]
+    await http.post(f"/api/atualizar_campo/{char_id}", json={"notas": "aba 2", "_versao": versao})
+
+    # A primeira aba ainda acha que está na 'versao'
+    resposta = await http.post(f"/api/atualizar_campo/{char_id}", json={"notas": "aba 1 de novo", "_versao": versao})
+    assert resposta.status_code == 409, resposta.text
+    corpo = resposta.json()
+    assert corpo["conflito"] and corpo["campos"]["notas"] == "aba 2", corpo
+    # Campo que ninguém mexeu desde então passa, mesmo com a versão velha
+    resposta = await http.post(f"/api/atualizar_campo/{char_id}", json={"nome": "Sem conflito", "_versao": versao})
+    assert resposta.status_code == 200 and resposta.json()["status"] == "success", resposta.text
+
+
+async def checar_saves_seguidos_mesma_aba(http):
+    char_id = await criar_jogador(http, "mesma_aba")
+    versao = (await http.post(f"/api/atualizar_campo/{char_id}", json={"nome": "Inicio"})).json()["versao"]
+
+    # Dois saves do mesmo campo antes da primeira resposta: os dois levam a mesma _versao
+    salvar = lambda valor, aba="aba-a": http.post(
+        f"/api/atualizar_campo/{char_id}", json={"notas": valor, "_versao": versao, "_aba": aba})
+    respostas = await asyncio.gather(salvar("clique 1"), salvar("clique 2"))
+    assert [r.status_code for r in respostas] == [200, 200], [r.text for r in respostas]
+
+    # Outra aba grava outro campo; esta ainda não viu e salva de novo o seu
+    await http.post(f"/api/atualizar_campo/{char_id}", json={"nome": "Outra", "_versao": versao, "_aba": "aba-b"})
+    assert (await salvar("clique 3")).status_code == 200
+
+    # Já o mesmo campo vindo de outra aba, sobre a versão velha, continua sendo conflito
+    resposta = await salvar("da aba b", aba="aba-b")
+    assert resposta.status_code == 409 and resposta.json()["campos"]["notas"] == "clique 3", resposta.text
+
+
+async def checar_desfazer_refazer(http):
+    char_id = await criar_jogador(http, "desfazer")
+    await http.post(f"/api/atualizar_campo/{char_id}", json={"notas": "primeira"})
+    await http.post(f"/api/atualizar_campo/{char_id}", json={"notas": "segunda"})
+
+    acao = lambda nome: http.post(f"/api/personagem/{char_id}/historico/{nome}")
+    assert (await acao("desfazer")).json()["campos"] == {"notas": "primeira"}
+    assert (await campos_atuais(http, char_id))["notas"] == "primeira"
+    assert (await acao("refazer")).json()["campos"] == {"notas": "segunda"}
+    assert (await campos_atuais(http, char_id))["notas"] == "segunda"
+
+    # Edição nova depois de desfazer limpa o que havia para refazer
+    await acao("desfazer")
+    await http.post(f"/api/atualizar_campo/{char_id}", json={"notas": "terceira"})
+    assert (await acao("refazer")).json()["status"] == "error"
+    historico = (await http.get(f"/api/personagem/{char_id}/historico")).json()
+    assert historico["pode_desfazer"] and not historico["pode_refazer"], historico
+
+
+# ==============================================================================
+# DIFUSÃO ENTRE WORKERS
+# ==============================================================================
+async def checar_difusao_roster(http):
+    # O app faz o papel de um worker; 'outro' (com roster próprio) é o segundo
+    outro, roster_outro = Difusao(), Roster()
+    outro.tratador("roster")(roster_outro.aplicar_remoto)
+    await difusao.iniciar("", TransporteMemoria())
+    await outro.iniciar("", TransporteMemoria())
+    try:
+        char_id = await criar_jogador(http, "difusao")
+        roster_outro.semear((await http.get("/api/active_characters")).json()["data"])
+        await http.post(f"/api/personagem/{char_id}/active")
+        assert await esperar(lambda: char_id in {f["id"] for f in roster_outro.snapshot()})
+
+        # Escrita neste worker chega ao roster do outro
+        await http.post(f"/api/atualizar_campo/{char_id}", json={"nome": "Visto de longe"})
+        assert await esperar(lambda: roster_outro._estado[char_id]["nome"] == "Visto de longe")
+
+        # E a escrita do outro chega aqui, sem reler o banco
+        outro.enviar("roster", {"tipo": "patch", "id": char_id, "campos": {"pv_max": 42}})
+        assert await esperar(lambda: roster._estado.get(char_id, {}).get("pv_max") == 42)
+        fichas = {f["id"]: f for f in (await http.get("/api/active_characters")).json()["data"]}
+        assert fichas[char_id]["pv_max"] == 42, fichas[char_id]
+
+        metricas = (await http.get("/metrics")).text
+        assert 'giharad_difusao_eventos_total{direcao="recebido",tipo="roster"}' in metricas
+    finally:
+        await outro.parar()
+        await difusao.parar()
+
+
+CHECAGENS = [
+    checar_contador_antes_de_ativar,
+    checar_contador_antes_da_regra,
+    checar_conflito_versao,
+    checar_saves_seguidos_mesma_aba,
+    checar_desfazer_refazer,
+    checar_difusao_roster,
+]
+
+
+async def main():
+    async with app.router.lifespan_context(app):
+        for checagem in CHECAGENS:
+            async with cliente() as http:
+                await checagem(http)
+            print(f"ok  {checagem.__name__}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
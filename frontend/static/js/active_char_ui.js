@@ -142,62 +142,120 @@ document.addEventListener('DOMContentLoaded', () => {
     container.id = 'active-chars-container';
     document.body.appendChild(container);
 
-    fetch('/api/active_characters')
-        .then(r => r.json())
-        .then(data => {
-            if (data.status === 'success' && data.data) {
-                data.data.forEach(p => {
-                    const card = document.createElement('a');
-                    card.href = `/ficha/${p.id}`;
-                    card.className = 'active-char-floating-card';
-
-                    const pctPv = p.pv_max > 0 ? (p.pv_atual / p.pv_max * 100) : 0;
-                    const pctPa = p.pa_max > 0 ? (p.pa_atual / p.pa_max * 100) : 0;
-                    const pctPh = p.ph_max > 0 ? (p.ph_atual / p.ph_max * 100) : 0;
-                    const pctPg = p.pg_max > 0 ? (p.pg_atual / p.pg_max * 100) : 0;
-
-                    let avatarHtml = '';
-                    if (p.avatar) {
-                        avatarHtml = `<img src="${p.avatar}" class="active-char-avatar">`;
-                    } else {
-                        avatarHtml = `
-                        <div class="active-char-avatar-placeholder">
-                            <span class="material-icons" style="font-size: 3em; color: var(--gold-dim);">account_circle</span>
-                        </div>
-                    `;
-                    }
-
-                    card.innerHTML = `
-                    ${avatarHtml}
-                    <div class="active-char-details">
-                        <div class="ac-name">${p.nome}</div>
-                        <div class="ac-info">${p.jogador} | Nv ${p.nivel}</div>
-                        <div class="ac-info" style="margin-top: -6px;">${p.classe} | ${p.raca}</div>
-                        
-                        <div class="ac-bars">
-                            <div class="ac-bar-row">
-                                <span class="ac-bar-label" style="color: #ef9a9a;">PV</span>
-                                <div class="ac-bar-track"><div class="ac-bar-fill" style="width: ${pctPv}%; background: #b71c1c;"></div></div>
-                            </div>
-                            <div class="ac-bar-row">
-                                <span class="ac-bar-label" style="color: #fff59d;">PA</span>
-                                <div class="ac-bar-track"><div class="ac-bar-fill" style="width: ${pctPa}%; background: #f57f17;"></div></div>
-                            </div>
-                            <div class="ac-bar-row">
-                                <span class="ac-bar-label" style="color: #90caf9;">PH</span>
-                                <div class="ac-bar-track"><div class="ac-bar-fill" style="width: ${pctPh}%; background: #0d47a1;"></div></div>
-                            </div>
-                            <div class="ac-bar-row">
-                                <span class="ac-bar-label" style="color: #e1bee7;">PG</span>
-                                <div class="ac-bar-track"><div class="ac-bar-fill" style="width: ${pctPg}%; background: #7b1fa2;"></div></div>
-                            </div>
-                        </div>
+    const cards = new Map(); // id -> { el, dados }
+
+    const pct = (atual, max) => max > 0 ? (atual / max * 100) : 0;
+
+    function renderizarCarta(p) {
+        const card = document.createElement('a');
+        card.href = `/ficha/${p.id}`;
+        card.className = 'active-char-floating-card';
+
+        let avatarHtml = '';
+        if (p.avatar) {
+            avatarHtml = `<img src="${p.avatar}" class="active-char-avatar" loading="lazy">`;
+        } else {
+            avatarHtml = `
+                <div class="active-char-avatar-placeholder">
+                    <span class="material-icons" style="font-size: 3em; color: var(--gold-dim);">account_circle</span>
+                </div>
+            `;
+        }
+
+        card.innerHTML = `
+            ${avatarHtml}
+            <div class="active-char-details">
+                <div class="ac-name">${p.nome}</div>
+                <div class="ac-info">${p.jogador} | Nv ${p.nivel}</div>
+                <div class="ac-info" style="margin-top: -6px;">${p.classe} | ${p.raca}</div>
+                
+                <div class="ac-bars">
+                    <div class="ac-bar-row">
+                        <span class="ac-bar-label" style="color: #ef9a9a;">PV</span>
+                        <div class="ac-bar-track"><div class="ac-bar-fill" data-bar="pv" style="width: ${pct(p.pv_atual, p.pv_max)}%; background: #b71c1c;"></div></div>
+                    </div>
+                    <div class="ac-bar-row">
+                        <span class="ac-bar-label" style="color: #fff59d;">PA</span>
+                        <div class="ac-bar-track"><div class="ac-bar-fill" data-bar="pa" style="width: ${pct(p.pa_atual, p.pa_max)}%; background: #f57f17;"></div></div>
+                    </div>
+                    <div class="ac-bar-row">
+                        <span class="ac-bar-label" style="color: #90caf9;">PH</span>
+                        <div class="ac-bar-track"><div class="ac-bar-fill" data-bar="ph" style="width: ${pct(p.ph_atual, p.ph_max)}%; background: #0d47a1;"></div></div>
+                    </div>
+                    <div class="ac-bar-row">
+                        <span class="ac-bar-label" style="color: #e1bee7;">PG</span>
+                        <div class="ac-bar-track"><div class="ac-bar-fill" data-bar="pg" style="width: ${pct(p.pg_atual, p.pg_max)}%; background: #7b1fa2;"></div></div>
                     </div>
-                `;
+                </div>
+            </div>
+        `;
+        return card;
+    }
+
+    function inserirCarta(p) {
+        const existente = cards.get(p.id);
+        const card = renderizarCarta(p);
+        if (existente) {
+            container.replaceChild(card, existente.el);
+        } else {
+            container.appendChild(card);
+        }
+        cards.set(p.id, { el: card, dados: { ...p } });
+    }
+
+    function removerCarta(id) {
+        const existente = cards.get(id);
+        if (!existente) return;
+        existente.el.remove();
+        cards.delete(id);
+    }
+
+    function aplicarPatch(id, campos) {
+        const existente = cards.get(id);
+        if (!existente) return;
+        Object.assign(existente.dados, campos);
+        const soBarras = Object.keys(campos).every(c => /^(pv|pa|ph|pg)_(atual|max)$/.test(c));
+        if (!soBarras) {
+            inserirCarta(existente.dados);
+            return;
+        }
+        // Atualização barata: só mexe na largura das barras (mantém a animação de transição)
+        const d = existente.dados;
+        ['pv', 'pa', 'ph', 'pg'].forEach(b => {
+            const fill = existente.el.querySelector(`[data-bar="${b}"]`);
+            if (fill) fill.style.width = `${pct(d[`${b}_atual`], d[`${b}_max`])}%`;
+        });
+    }
+
+    function aplicarSnapshot(lista) {
+        const ids = new Set(lista.map(p => p.id));
+        Array.from(cards.keys()).forEach(id => { if (!ids.has(id)) removerCarta(id); });
+        lista.forEach(inserirCarta);
+    }
+
+    function carregarUmaVez() {
+        fetch('/api/active_characters')
+            .then(r => r.json())
+            .then(data => {
+                if (data.status === 'success' && data.data) aplicarSnapshot(data.data);
+            })
+            .catch(e => console.error("Erro ao carregar fichas ativas:", e));
+    }
+
+    if (!window.EventSource) {
+        carregarUmaVez();
+        return;
+    }
 
-                    container.appendChild(card);
-                });
-            }
-        })
-        .catch(e => console.error("Erro ao carregar fichas ativas:", e));
+    // Stream de eventos: snapshot inicial e depois apenas diferenças.
+    // O EventSource reconecta sozinho e recebe um novo snapshot a cada reconexão.
+    const fonte = new EventSource('/api/active_characters/stream');
+    fonte.addEventListener('snapshot', e => aplicarSnapshot(JSON.parse(e.data)));
+    fonte.addEventListener('entrada', e => inserirCarta(JSON.parse(e.data).ficha));
+    fonte.addEventListener('saida', e => removerCarta(JSON.parse(e.data).id));
+    fonte.addEventListener('patch', e => {
+        const evento = JSON.parse(e.data);
+        aplicarPatch(evento.id, evento.campos);
+    });
+    fonte.onerror = () => console.warn("Stream de fichas ativas interrompido, reconectando...");
 });
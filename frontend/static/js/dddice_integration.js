@@ -137,18 +137,17 @@ function desconectarDddice() {
 
 /**
  * Rola dados de um atributo da ficha com expertise, incapacidade e bônus.
+ * Sem dddice conectado, rola no servidor; sem servidor (offline), no navegador.
  * @param {string} tipo       - dado do atributo, ex: 'd8'
  * @param {string} label      - nome do atributo, ex: 'Físico'
  * @param {number} bonus      - bônus/penalidade fixo
  * @param {number} expTipo    - faces do dado de expertise (0 = sem expertise)
  * @param {number} incTipo    - faces do dado de incapacidade (0 = sem incapacidade)
+ * @param {string} atributo   - campo da ficha, ex: 'fisico' (para a rolagem no servidor)
  */
-async function rolarAtributo(tipo, label, bonus, expTipo, incTipo) {
+async function rolarAtributo(tipo, label, bonus, expTipo, incTipo, atributo) {
     if (!dddiceConectado || !dddiceInstance) {
-        if (typeof mostrarToast === 'function') {
-            mostrarToast('⚠️ Conecte ao dddice primeiro!', 'info');
-        }
-        return;
+        return rolarSemDddice(tipo, label, bonus, expTipo, incTipo, atributo);
     }
 
     try {
@@ -175,11 +174,7 @@ async function rolarAtributo(tipo, label, bonus, expTipo, incTipo) {
         }
 
         // Monta label descritivo para a sala ver
-        let descricao = tipo;
-        if (expTipo > 0) descricao += ` +d${expTipo}`;
-        if (incTipo > 0) descricao += ` -d${incTipo}`;
-        if (mod > 0) descricao += ` +${mod}`;
-        if (mod < 0) descricao += ` ${mod}`;
+        const descricao = formulaRolagem(tipo, expTipo, incTipo, mod);
 
         // Guarda quantos dados são de incapacidade para o RollFinished subtrair
         dddiceInstance._giharadIncDados = numIncDados;
@@ -197,6 +192,116 @@ async function rolarAtributo(tipo, label, bonus, expTipo, incTipo) {
     }
 }
 
+function formulaRolagem(tipo, expTipo, incTipo, mod) {
+    let descricao = tipo;
+    if (expTipo > 0) descricao += ` +d${expTipo}`;
+    if (incTipo > 0) descricao += ` -d${incTipo}`;
+    if (mod > 0) descricao += ` +${mod}`;
+    if (mod < 0) descricao += ` ${mod}`;
+    return descricao;
+}
+
+// -------------------------------------------------------------------------
+// Rolagem sem dddice: servidor (auditada) ou navegador (offline)
+// -------------------------------------------------------------------------
+
+async function rolarSemDddice(tipo, label, bonus, expTipo, incTipo, atributo) {
+    const fichaId = document.body.dataset.fichaId;
+    if (fichaId && atributo) {
+        let resp;
+        try {
+            const r = await fetch(`/api/personagem/${fichaId}/rolar`, {
+                method: 'POST', headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ atributo }),
+            });
+            resp = await r.json();
+        } catch (err) {
+            // Sem conexão: cai para a rolagem local abaixo
+            console.warn('[dados] Servidor indisponível, rolando no navegador:', err?.message || err);
+        }
+        if (resp) {
+            if (resp.status !== 'success') {
+                if (typeof mostrarToast === 'function') {
+                    mostrarToast(resp.message || 'Erro ao rolar dado!', 'error');
+                }
+                return;
+            }
+            const resultado = resp.resultados[0];
+            const rolagem = resultado.rolagens[0];
+            const pos = [{ value: rolagem.atributo }];
+            if (rolagem.expertise !== null) pos.push({ value: rolagem.expertise });
+            const inc = rolagem.incapacidade !== null ? [{ value: rolagem.incapacidade }] : [];
+            mostrarResultadoRolagem(
+                `${label} (${resultado.formula})`, rolagem.total, pos, inc, parseInt(bonus) || 0,
+                textoChance(rolagem.chance, rolagem.total),
+            );
+            return resultado;
+        }
+    }
+
+    // Offline: mesmo cálculo, sem registro de auditoria
+    const dado = parseInt(String(tipo).replace('d', '')) || 0;
+    const mod = parseInt(bonus) || 0;
+    const pos = [{ value: sortearDado(dado) }];
+    if (expTipo > 0) pos.push({ value: sortearDado(expTipo) });
+    const inc = incTipo > 0 ? [{ value: sortearDado(incTipo) }] : [];
+    const total = pos.reduce((s, d) => s + d.value, 0) - inc.reduce((s, d) => s + d.value, 0) + mod;
+    const chance = chanceMinima(dado, expTipo, incTipo, mod, total);
+    mostrarResultadoRolagem(
+        `${label} (${formulaRolagem(tipo, expTipo, incTipo, mod)}, offline)`, total, pos, inc, mod,
+        textoChance(chance, total),
+    );
+}
+
+function sortearDado(faces) {
+    // Rejeição para não enviesar faces que não dividem 2^32
+    const limite = Math.floor(0x100000000 / faces) * faces;
+    const buffer = new Uint32Array(1);
+    do { crypto.getRandomValues(buffer); } while (buffer[0] >= limite);
+    return (buffer[0] % faces) + 1;
+}
+
+// -------------------------------------------------------------------------
+// Chances (tabelas exatas calculadas pelo servidor, baixadas uma vez)
+// -------------------------------------------------------------------------
+
+let tabelasDados = null;
+
+async function carregarDistribuicoes() {
+    if (tabelasDados) return tabelasDados;
+    try {
+        const r = await fetch('/api/dados/distribuicoes');
+        tabelasDados = (await r.json()).tabelas || null;
+    } catch (_) { /* Offline: rolagens seguem sem chance */ }
+    return tabelasDados;
+}
+
+/** P(total >= alvo), ou null se as tabelas ainda não chegaram. */
+function chanceMinima(dado, expTipo, incTipo, bonus, alvo) {
+    const tabela = tabelasDados && tabelasDados[`${dado}/${expTipo || 0}/${incTipo || 0}`];
+    if (!tabela) return null;
+    const inicio = Math.max(alvo - (bonus || 0) - tabela.minimo, 0);
+    return tabela.contagens.slice(inicio).reduce((s, c) => s + c, 0) / tabela.total;
+}
+
+function textoChance(chance, total) {
+    if (chance === null || chance === undefined) return '';
+    return `chance de ≥${total}: ${Math.round(chance * 100)}%`;
+}
+
+/** Tooltip do botão de rolar: média e chances de alguns alvos. */
+function mostrarChances(botao, dado, expTipo, incTipo, bonus) {
+    if (!botao.dataset.tituloBase) botao.dataset.tituloBase = botao.title;
+    const tabela = tabelasDados && tabelasDados[`${dado}/${expTipo || 0}/${incTipo || 0}`];
+    if (!tabela) {
+        carregarDistribuicoes();
+        return;
+    }
+    const media = tabela.media + (bonus || 0);
+    const alvos = [5, 10, 15].map(alvo => `≥${alvo}: ${Math.round(chanceMinima(dado, expTipo, incTipo, bonus, alvo) * 100)}%`);
+    botao.title = `${botao.dataset.tituloBase}\nMédia ${media.toFixed(1)} | ${alvos.join(' | ')}`;
+}
+
 // -------------------------------------------------------------------------
 // UI — Status e Resultado
 // -------------------------------------------------------------------------
@@ -225,7 +330,7 @@ function atualizarStatusDddice(estado) {
     }
 }
 
-function mostrarResultadoRolagem(label, total, posDados, incDados, mod) {
+function mostrarResultadoRolagem(label, total, posDados, incDados, mod, extra = '') {
     // Monta string de detalhamento
     const partes = [];
     if (posDados && posDados.length) {
@@ -238,7 +343,7 @@ function mostrarResultadoRolagem(label, total, posDados, incDados, mod) {
         partes.push((mod > 0 ? '+' : '') + mod);
     }
     const detalhe = partes.length > 1 ? ` (${partes.join(' ')})` : '';
-    const msg = `🎲 ${label}: **${total}**${detalhe}`;
+    const msg = `🎲 ${label}: **${total}**${detalhe}${extra ? ` — ${extra}` : ''}`;
     if (typeof mostrarToast === 'function') {
         mostrarToast(msg, 'success');
     } else {
@@ -342,6 +447,7 @@ function abrirPainelDddice() {
 // -------------------------------------------------------------------------
 
 document.addEventListener('DOMContentLoaded', () => {
+    carregarDistribuicoes();
     const apiKey = localStorage.getItem(LS_API_KEY);
     const roomSlug = localStorage.getItem(LS_ROOM_SLUG);
     if (apiKey && roomSlug) {